@@ -0,0 +1,257 @@
+# Index advisor and query plan benchmark for the sm_app.sqlite schema
+#
+# For every registered query (sm_schema.queries) this script
+# - captures the EXPLAIN QUERY PLAN output
+# - proposes covering indexes for the join and GROUP BY columns that aren't
+#   indexed yet (e.g. comments.post_id, comments.user_id, likes.post_id)
+# - optionally creates them
+# - benchmarks the query before and after on a synthetic data set, for a
+#   range of sizes, to see where the join queries stop scaling
+#
+# Usage:
+# python index_advisor.py advise sm_app.sqlite
+# python index_advisor.py advise sm_app.sqlite --create
+# python index_advisor.py benchmark --scales 100000 1000000 10000000
+#
+# Sources:
+# https://www.sqlite.org/eqp.html
+# https://www.sqlite.org/queryplanner.html#covidx
+
+import os
+import re
+import sqlite3
+import argparse
+import tempfile
+import statistics
+import time
+
+import sm_schema
+from sqlite_pool import ConnectionPool, quote_identifier
+from sm_datagen import SocialMediaGenerator
+
+###################
+# Query structure #
+###################
+
+sql_keywords = {"on", "inner", "left", "right", "full", "cross", "join",
+                "where", "group", "order", "limit", "natural", "using"}
+
+
+# Return the plan of a query as a list of (id, parent, detail) tuples
+def explain(connection, query, parameters=()):
+    plan = connection.execute("EXPLAIN QUERY PLAN " + query, parameters).fetchall()
+    return [(x[0], x[1], x[3]) for x in plan]
+
+
+def format_plan(plan):
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, detail in plan:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return "\n".join(lines)
+
+
+# Tables used in the query, as a dict alias -> table
+def query_tables(query):
+    tables = {}
+    pattern = r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?"
+    for table, alias in re.findall(pattern, query, flags=re.IGNORECASE):
+        if not alias or alias.lower() in sql_keywords:
+            alias = table
+        tables[alias] = table
+    return tables
+
+
+def table_columns(connection, table):
+    info = connection.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall()
+    columns = [x[1] for x in info]
+    # An INTEGER PRIMARY KEY is the rowid, it is part of every index already
+    rowid = [x[1] for x in info if x[5] == 1 and x[2].upper() == "INTEGER"]
+    return columns, (rowid[0] if len(rowid) == 1 else None)
+
+
+# Columns of each table in the query that are used in join conditions,
+# in the GROUP BY clause and anywhere else in the query
+def query_columns(connection, query):
+    tables = query_tables(query)
+    columns = {alias: table_columns(connection, table)[0]
+               for alias, table in tables.items()}
+    used = {alias: {"join": [], "group": [], "other": []} for alias in tables}
+
+    def add(alias, column, kind):
+        if alias in used and column not in used[alias][kind]:
+            used[alias][kind].append(column)
+
+    join_pattern = r"\bON\s+(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)"
+    for left, left_column, right, right_column in re.findall(
+            join_pattern, query, flags=re.IGNORECASE):
+        add(left, left_column, "join")
+        add(right, right_column, "join")
+
+    group_by = re.search(r"\bGROUP\s+BY\s+(.+?)(?:\bHAVING\b|\bORDER\b|\bLIMIT\b|$)",
+                         query, flags=re.IGNORECASE | re.DOTALL)
+    if group_by:
+        for alias, column in re.findall(r"(\w+)\.(\w+)", group_by.group(1)):
+            add(alias, column, "group")
+
+    for alias, column in re.findall(r"(\w+)\.(\w+)", query):
+        add(alias, column, "other")
+    # Unqualified column names that belong to exactly one of the tables
+    for name in set(re.findall(r"(?<![.\w])(\w+)(?![.\w])", query)):
+        owners = [alias for alias in tables if name in columns[alias]]
+        if len(owners) == 1:
+            add(owners[0], name, "other")
+
+    return tables, used
+
+
+def existing_indexes(connection, table):
+    indexes = []
+    for index in connection.execute(
+            f"PRAGMA index_list({quote_identifier(table)})").fetchall():
+        info = connection.execute(
+            f"PRAGMA index_info({quote_identifier(index[1])})").fetchall()
+        indexes.append([x[2] for x in sorted(info)])
+    return indexes
+
+##################
+# Index proposal #
+##################
+
+# Propose a covering index for every table that is joined or grouped on a
+# column without an index. The key columns are the join and GROUP BY
+# columns, the remaining columns the query reads from the table are appended
+# so SQLite never has to look up the table row itself.
+def propose_indexes(connection, query):
+    tables, used = query_columns(connection, query)
+    proposals = []
+    for alias, table in tables.items():
+        _, rowid = table_columns(connection, table)
+        key = [x for x in used[alias]["join"] + used[alias]["group"] if x != rowid]
+        key = list(dict.fromkeys(key))
+        if not key:
+            continue
+        if any(index[:1] == key[:1] for index in existing_indexes(connection, table)):
+            continue
+        extra = [x for x in used[alias]["other"] if x != rowid and x not in key]
+        index_columns = key + extra
+        name = "idx_" + table + "_" + "_".join(index_columns)
+        sql = (f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} ON "
+               f"{quote_identifier(table)} "
+               f"({', '.join(quote_identifier(x) for x in index_columns)})")
+        proposals.append({"table": table, "name": name,
+                          "columns": index_columns, "sql": sql})
+    return proposals
+
+
+def create_indexes(connection, proposals):
+    for proposal in proposals:
+        connection.execute(proposal["sql"])
+    # Update the statistics the query planner uses to choose an index
+    connection.execute("ANALYZE")
+
+
+def drop_indexes(connection, proposals):
+    for proposal in proposals:
+        connection.execute(f"DROP INDEX IF EXISTS {quote_identifier(proposal['name'])}")
+
+
+def advise(connection, queries, create=False):
+    all_proposals = {}
+    for name, query in queries.items():
+        print(f"### {name}")
+        print(format_plan(explain(connection, query)))
+        proposals = propose_indexes(connection, query)
+        for proposal in proposals:
+            print("Proposed: " + proposal["sql"])
+            all_proposals[proposal["name"]] = proposal
+        if not proposals:
+            print("No indexes proposed")
+        print()
+    if create and all_proposals:
+        create_indexes(connection, all_proposals.values())
+        print(f"Created {len(all_proposals)} indexes")
+    return list(all_proposals.values())
+
+##################
+# Synthetic data #
+##################
+
+def populate(pool, n_likes, seed=0):
+    SocialMediaGenerator.from_likes(n_likes, seed=seed).load(pool)
+
+#############
+# Benchmark #
+#############
+
+# Median wall time of running a query and reading all of its rows
+def time_query(connection, query, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor = connection.execute(query)
+        while cursor.fetchmany(10000):
+            pass
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def benchmark(scales, queries, repeat=3, directory=None, seed=0):
+    directory = directory or tempfile.mkdtemp()
+    results = []
+    for scale in scales:
+        path = os.path.join(directory, f"sm_app_{scale}.sqlite")
+        if os.path.exists(path):
+            os.remove(path)
+        with ConnectionPool(path, size=1) as pool:
+            start = time.perf_counter()
+            populate(pool, scale, seed=seed)
+            print(f"Loaded {scale} likes in {time.perf_counter() - start:.1f} s")
+            with pool.connection() as connection:
+                proposals = {}
+                for query in queries.values():
+                    for proposal in propose_indexes(connection, query):
+                        proposals[proposal["name"]] = proposal
+                before = {name: time_query(connection, query, repeat)
+                          for name, query in queries.items()}
+                create_indexes(connection, proposals.values())
+                after = {name: time_query(connection, query, repeat)
+                         for name, query in queries.items()}
+                plans = {name: format_plan(explain(connection, query))
+                         for name, query in queries.items()}
+        os.remove(path)
+        for name in queries:
+            results.append({"scale": scale, "query": name,
+                            "before": before[name], "after": after[name]})
+            print(f"{name} @ {scale}: {before[name] * 1000:.1f} ms -> "
+                  f"{after[name] * 1000:.1f} ms "
+                  f"({before[name] / after[name]:.1f}x)")
+            print(plans[name])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_advise = subparsers.add_parser("advise", help="propose indexes for a database")
+    parser_advise.add_argument("database")
+    parser_advise.add_argument("--create", action="store_true",
+                               help="create the proposed indexes")
+
+    parser_benchmark = subparsers.add_parser(
+        "benchmark", help="benchmark the queries on synthetic data")
+    parser_benchmark.add_argument("--scales", type=int, nargs="+",
+                                  default=[10**5, 10**6, 10**7],
+                                  help="number of likes; the other tables are scaled along")
+    parser_benchmark.add_argument("--repeat", type=int, default=3)
+    parser_benchmark.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "advise":
+        connection = sqlite3.connect(args.database, isolation_level=None)
+        advise(connection, sm_schema.queries, create=args.create)
+        connection.close()
+    else:
+        benchmark(args.scales, sm_schema.queries, repeat=args.repeat, seed=args.seed)
@@ -0,0 +1,183 @@
+# Materialized like counts for the sm_app.sqlite schema
+#
+# select_post_likes in sql_python.py counts the likes of every post with a
+# LEFT JOIN and GROUP BY over the whole likes table on every call.
+# This module adds an (optional) table post_like_counts with the number of
+# likes per post. Triggers on likes keep it up to date, so reading the like
+# count of a post is a single primary key lookup.
+#
+# Usage:
+# python like_counts.py install sm_app.sqlite   # create table and triggers
+# python like_counts.py check sm_app.sqlite     # compare with the likes table
+# python like_counts.py rebuild sm_app.sqlite   # recompute from the likes table
+# python like_counts.py drop sm_app.sqlite      # remove table and triggers
+#
+# Source:
+# https://www.sqlite.org/lang_createtrigger.html
+
+import sys
+import sqlite3
+
+create_post_like_counts_table = """
+CREATE TABLE IF NOT EXISTS post_like_counts (
+  post_id INTEGER PRIMARY KEY,
+  likes INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+create_like_insert_trigger = """
+CREATE TRIGGER IF NOT EXISTS likes_after_insert AFTER INSERT ON likes
+BEGIN
+  INSERT INTO post_like_counts (post_id, likes) VALUES (NEW.post_id, 1)
+    ON CONFLICT (post_id) DO UPDATE SET likes = likes + 1;
+END;
+"""
+
+create_like_delete_trigger = """
+CREATE TRIGGER IF NOT EXISTS likes_after_delete AFTER DELETE ON likes
+BEGIN
+  UPDATE post_like_counts SET likes = likes - 1 WHERE post_id = OLD.post_id;
+END;
+"""
+
+# A like that is moved to another post
+create_like_update_trigger = """
+CREATE TRIGGER IF NOT EXISTS likes_after_update AFTER UPDATE OF post_id ON likes
+  WHEN OLD.post_id IS NOT NEW.post_id
+BEGIN
+  UPDATE post_like_counts SET likes = likes - 1 WHERE post_id = OLD.post_id;
+  INSERT INTO post_like_counts (post_id, likes) VALUES (NEW.post_id, 1)
+    ON CONFLICT (post_id) DO UPDATE SET likes = likes + 1;
+END;
+"""
+
+rebuild_post_like_counts = """
+DELETE FROM post_like_counts;
+INSERT INTO post_like_counts (post_id, likes)
+  SELECT post_id, COUNT(*) FROM likes GROUP BY post_id;
+"""
+
+# Posts for which the stored count differs from the number of rows in likes,
+# as (post_id, stored count, actual count)
+select_inconsistent_like_counts = """
+SELECT actual.post_id, COALESCE(stored.likes, 0), actual.likes
+FROM
+  (SELECT post_id, COUNT(*) as likes FROM likes GROUP BY post_id) as actual
+  LEFT JOIN post_like_counts as stored ON stored.post_id = actual.post_id
+WHERE
+  COALESCE(stored.likes, 0) != actual.likes
+UNION ALL
+SELECT stored.post_id, stored.likes, 0
+FROM
+  post_like_counts as stored
+WHERE
+  stored.likes != 0
+  AND NOT EXISTS (SELECT 1 FROM likes WHERE likes.post_id = stored.post_id)
+"""
+
+# Same result as select_post_likes, read from the materialized counts.
+# Unlike select_post_likes, which groups on likes.post_id and therefore puts
+# all posts without likes in one group, this returns one row per post.
+select_post_likes_materialized = """
+SELECT
+  description as Post,
+  COALESCE(post_like_counts.likes, 0) as Likes
+FROM
+  posts
+  LEFT JOIN post_like_counts ON posts.id = post_like_counts.post_id
+"""
+
+
+# The connection is expected to be in autocommit mode
+# (isolation_level=None), e.g. a connection from sqlite_pool.ConnectionPool
+def install(connection):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute(create_post_like_counts_table)
+        connection.execute(create_like_insert_trigger)
+        connection.execute(create_like_delete_trigger)
+        connection.execute(create_like_update_trigger)
+        for statement in rebuild_post_like_counts.split(";")[:-1]:
+            connection.execute(statement)
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+
+
+def drop(connection):
+    connection.executescript("""
+    DROP TRIGGER IF EXISTS likes_after_insert;
+    DROP TRIGGER IF EXISTS likes_after_delete;
+    DROP TRIGGER IF EXISTS likes_after_update;
+    DROP TABLE IF EXISTS post_like_counts;
+    """)
+
+
+def rebuild(connection):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        for statement in rebuild_post_like_counts.split(";")[:-1]:
+            connection.execute(statement)
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+
+
+def check(connection):
+    return connection.execute(select_inconsistent_like_counts).fetchall()
+
+#############
+# Read data #
+#############
+
+def get_like_count(connection, post_id):
+    row = connection.execute(
+        "SELECT likes FROM post_like_counts WHERE post_id = ?", (post_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+# Like counts for several posts as a dict post_id -> count
+def get_like_counts(connection, post_ids):
+    post_ids = list(post_ids)
+    counts = dict.fromkeys(post_ids, 0)
+    # Stay below SQLite's limit on the number of parameters in a query
+    for i in range(0, len(post_ids), 500):
+        batch = post_ids[i:i + 500]
+        placeholders = ", ".join("?" for _ in batch)
+        counts.update(connection.execute(
+            f"SELECT post_id, likes FROM post_like_counts WHERE post_id IN ({placeholders})",
+            batch,
+        ).fetchall())
+    return counts
+
+
+if __name__ == "__main__":
+    commands = {"install", "check", "rebuild", "drop"}
+    if len(sys.argv) != 3 or sys.argv[1] not in commands:
+        print("Usage: python like_counts.py {install,check,rebuild,drop} database")
+        sys.exit(2)
+
+    command, path = sys.argv[1:]
+    connection = sqlite3.connect(path, isolation_level=None)
+    if command == "install":
+        install(connection)
+        print("Installed post_like_counts")
+    elif command == "rebuild":
+        rebuild(connection)
+        print("Rebuilt post_like_counts")
+    elif command == "drop":
+        drop(connection)
+        print("Dropped post_like_counts")
+    else:
+        inconsistent = check(connection)
+        for post_id, stored, actual in inconsistent:
+            print(f"post {post_id}: stored {stored}, actual {actual}")
+        if inconsistent:
+            print(f"{len(inconsistent)} posts with wrong like counts, "
+                  "run 'python like_counts.py rebuild' to fix them")
+            sys.exit(1)
+        print("post_like_counts is consistent")
+    connection.close()
@@ -0,0 +1,201 @@
+# Load test for the sm_app.sqlite schema
+#
+# Runs a mix of reads, updates and deletes, modelled on the examples in
+# sql_python.py, from several threads against a (synthetic) database and
+# reports the throughput and the p50/p99 latency per operation.
+# Posts are picked with the same Zipf skew as the generated data, so hot
+# posts are read and updated more often.
+# Without the indexes proposed by index_advisor.py the per-post reads scan
+# the comments and likes tables; to compare, create them first with
+# python index_advisor.py advise <database> --create
+#
+# Usage:
+# python load_test.py --likes 1000000 --threads 8 --duration 30
+# python load_test.py --database sm_app_large.sqlite --mix read_post_comments=0.5,update_post=0.5
+
+import os
+import random
+import argparse
+import tempfile
+import threading
+import time
+
+from sqlite_pool import ConnectionPool
+from sm_datagen import SocialMediaGenerator, ZipfSampler
+
+##############
+# Operations #
+##############
+
+# Each operation gets a random generator and the id samplers, and returns
+# (query, parameters)
+def read_post_comments(rng, samplers):
+    return ("""
+    SELECT
+      posts.description as post,
+      text as comment,
+      name
+    FROM
+      posts
+      INNER JOIN comments ON posts.id = comments.post_id
+      INNER JOIN users ON users.id = comments.user_id
+    WHERE
+      posts.id = ?
+    """, (samplers["posts"].sample(1, rng)[0],))
+
+
+def read_post_likes(rng, samplers):
+    return ("SELECT COUNT(*) FROM likes WHERE post_id = ?",
+            (samplers["posts"].sample(1, rng)[0],))
+
+
+def read_post_description(rng, samplers):
+    return ("SELECT description FROM posts WHERE id = ?",
+            (samplers["posts"].sample(1, rng)[0],))
+
+
+def update_post(rng, samplers):
+    return ("UPDATE posts SET description = ? WHERE id = ?",
+            (f"The weather has become pleasant now {rng.random()}",
+             samplers["posts"].sample(1, rng)[0]))
+
+
+def delete_comment(rng, samplers):
+    return ("DELETE FROM comments WHERE id = ?",
+            (rng.randint(1, samplers["n_comments"]),))
+
+
+def insert_like(rng, samplers):
+    return ("INSERT INTO likes (user_id, post_id) VALUES (?, ?)",
+            (rng.randint(1, samplers["n_users"]), samplers["posts"].sample(1, rng)[0]))
+
+
+operations = {
+    "read_post_comments": (read_post_comments, "read"),
+    "read_post_likes": (read_post_likes, "read"),
+    "read_post_description": (read_post_description, "read"),
+    "update_post": (update_post, "write"),
+    "delete_comment": (delete_comment, "write"),
+    "insert_like": (insert_like, "write"),
+}
+
+default_mix = {
+    "read_post_comments": 0.3,
+    "read_post_likes": 0.3,
+    "read_post_description": 0.2,
+    "update_post": 0.1,
+    "delete_comment": 0.05,
+    "insert_like": 0.05,
+}
+
+##############
+# Statistics #
+##############
+
+# Nearest-rank percentile of a sorted list
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    rank = max(int(round(p / 100 * len(sorted_values))), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def report(latencies, elapsed):
+    total = sum(len(x) for x in latencies.values())
+    print(f"{total} operations in {elapsed:.1f} s: {total / elapsed:,.0f} ops/s")
+    print(f"{'operation':<24}{'count':>9}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, values in sorted(latencies.items()):
+        values = sorted(values)
+        print(f"{name:<24}{len(values):>9}{len(values) / elapsed:>10,.0f}"
+              f"{percentile(values, 50) * 1000:>10.2f}"
+              f"{percentile(values, 99) * 1000:>10.2f}")
+
+############
+# Run test #
+############
+
+def run(pool, generator, mix, threads=4, duration=10.0, seed=0):
+    names = list(mix)
+    weights = [mix[x] for x in names]
+    latencies = {x: [] for x in names}
+    errors = []
+    lock = threading.Lock()
+    # Same random generator as SocialMediaGenerator.likes(), so the posts
+    # that are hot in the test are the posts with the most likes
+    samplers = {
+        "posts": ZipfSampler(generator.n_posts, generator.zipf_s,
+                             random.Random(f"{generator.seed}-likes")),
+        "n_users": generator.n_users,
+        "n_comments": generator.n_comments,
+    }
+    stop = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(f"{seed}-{worker_id}")
+        local = {x: [] for x in names}
+        while time.perf_counter() < stop:
+            name = rng.choices(names, weights=weights)[0]
+            function, kind = operations[name]
+            query, parameters = function(rng, samplers)
+            start = time.perf_counter()
+            try:
+                if kind == "read":
+                    pool.read_query(query, parameters)
+                else:
+                    pool.execute(query, parameters)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+                continue
+            local[name].append(time.perf_counter() - start)
+        with lock:
+            for name in names:
+                latencies[name].extend(local[name])
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for x in workers:
+        x.start()
+    for x in workers:
+        x.join()
+    elapsed = time.perf_counter() - start
+
+    report(latencies, elapsed)
+    if errors:
+        print(f"{len(errors)} errors, first: {errors[0]}")
+    return latencies
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, weight = item.split("=")
+        if name not in operations:
+            raise argparse.ArgumentTypeError(
+                f"unknown operation '{name}', choose from {', '.join(operations)}")
+        mix[name] = float(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database",
+                        help="existing database generated with sm_datagen.py "
+                             "with the same --likes, --zipf and --seed; "
+                             "by default a new one is generated")
+    parser.add_argument("--likes", type=int, default=10**5)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--mix", type=parse_mix, default=default_mix,
+                        help="e.g. read_post_likes=0.8,update_post=0.2")
+    args = parser.parse_args()
+
+    generator = SocialMediaGenerator.from_likes(args.likes, zipf_s=args.zipf,
+                                                seed=args.seed)
+    path = args.database or os.path.join(tempfile.mkdtemp(), "sm_app_load_test.sqlite")
+    with ConnectionPool(path, size=args.threads) as pool:
+        if not args.database:
+            generator.load(pool, verbose=True)
+        run(pool, generator, args.mix, threads=args.threads,
+            duration=args.duration, seed=args.seed)
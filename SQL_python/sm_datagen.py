@@ -0,0 +1,151 @@
+# Synthetic data for the sm_app.sqlite schema
+#
+# Generates users, posts, comments and likes of any size, row by row, so the
+# data never has to fit in memory. Activity is skewed like on a real social
+# media site: the number of posts per user and the number of comments and
+# likes per post follow a Zipf distribution, so a few users and posts get
+# most of the activity. The same seed always gives the same data.
+#
+# Usage:
+# python sm_datagen.py sm_app_large.sqlite --likes 10000000
+#
+# Sources:
+# https://en.wikipedia.org/wiki/Zipf%27s_law
+# https://docs.python.org/3/library/random.html#random.choices
+
+import random
+import argparse
+import itertools
+import time
+
+import sm_schema
+from sqlite_pool import ConnectionPool
+
+first_names = ["James", "Leila", "Brigitte", "Mike", "Elizabeth", "Anna",
+               "Tom", "Sofia", "Lucas", "Emma", "Noah", "Mia"]
+nationalities = ["USA", "France", "England", "Denmark", "Canada", "Belgium",
+                 "Germany", "Spain", "Italy", "Japan"]
+words = ["happy", "weather", "help", "news", "game", "party", "work",
+         "today", "tennis", "married", "congrats", "thesis", "hot", "late"]
+
+
+# Cumulative Zipf weights for ranks 1..n: weight of rank k is 1 / k^s
+def zipf_cum_weights(n, s):
+    total = 0.0
+    cum_weights = []
+    for k in range(1, n + 1):
+        total += 1.0 / k ** s
+        cum_weights.append(total)
+    return cum_weights
+
+
+class ZipfSampler:
+
+    # Ids 1..n are shuffled before ranks are assigned, so the most popular
+    # ids are spread over the table instead of all being at the start
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        self.ids = list(range(1, n + 1))
+        rng.shuffle(self.ids)
+        self.cum_weights = zipf_cum_weights(n, s)
+
+    # rng can be given to sample from several threads with their own
+    # random generator
+    def sample(self, k, rng=None):
+        rng = rng or self.rng
+        return rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+    # Endless stream of ids, sampled batch_size at a time
+    def stream(self, batch_size=10000):
+        while True:
+            yield from self.sample(batch_size)
+
+
+class SocialMediaGenerator:
+
+    def __init__(self, n_users, n_posts, n_comments, n_likes, zipf_s=1.1, seed=0):
+        self.n_users = n_users
+        self.n_posts = n_posts
+        self.n_comments = n_comments
+        self.n_likes = n_likes
+        self.zipf_s = zipf_s
+        self.seed = seed
+
+    # 100 likes per user, 10 likes and 5 comments per post on average
+    @classmethod
+    def from_likes(cls, n_likes, **kwargs):
+        return cls(n_users=max(n_likes // 100, 5), n_posts=max(n_likes // 10, 5),
+                   n_comments=max(n_likes // 2, 5), n_likes=n_likes, **kwargs)
+
+    # Every table gets its own random generator, so a table can be generated
+    # on its own and still gives the same rows
+    def _rng(self, table):
+        return random.Random(f"{self.seed}-{table}")
+
+    def _text(self, rng, n_words):
+        return " ".join(rng.choice(words) for _ in range(n_words)).capitalize()
+
+    def users(self):
+        rng = self._rng("users")
+        for i in range(self.n_users):
+            yield (f"{rng.choice(first_names)} {i + 1}", rng.randint(16, 80),
+                   rng.choice(("male", "female")), rng.choice(nationalities))
+
+    def posts(self):
+        rng = self._rng("posts")
+        authors = ZipfSampler(self.n_users, self.zipf_s, rng).stream()
+        for user_id in itertools.islice(authors, self.n_posts):
+            yield (self._text(rng, 2), self._text(rng, rng.randint(4, 12)), user_id)
+
+    def comments(self):
+        rng = self._rng("comments")
+        posts = ZipfSampler(self.n_posts, self.zipf_s, rng).stream()
+        users = ZipfSampler(self.n_users, self.zipf_s, rng).stream()
+        for post_id, user_id in itertools.islice(zip(posts, users), self.n_comments):
+            yield (self._text(rng, rng.randint(2, 8)), user_id, post_id)
+
+    # Likes per post are Zipf distributed, the users that like are uniform
+    def likes(self):
+        rng = self._rng("likes")
+        posts = ZipfSampler(self.n_posts, self.zipf_s, rng).stream()
+        for post_id in itertools.islice(posts, self.n_likes):
+            yield (rng.randint(1, self.n_users), post_id)
+
+    def tables(self):
+        return {"users": self.users(), "posts": self.posts(),
+                "comments": self.comments(), "likes": self.likes()}
+
+    def load(self, pool, batch_size=50000, verbose=False):
+        with pool.connection() as connection:
+            sm_schema.create_schema(connection)
+        for table, rows in self.tables().items():
+            start = time.perf_counter()
+            n = pool.bulk_insert(table, sm_schema.columns[table], rows,
+                                 batch_size=batch_size)
+            if verbose:
+                elapsed = time.perf_counter() - start
+                print(f"{table}: {n} rows in {elapsed:.1f} s "
+                      f"({n / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("database")
+    parser.add_argument("--likes", type=int, default=10**6,
+                        help="number of likes; the other tables are scaled along")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--posts", type=int)
+    parser.add_argument("--comments", type=int)
+    parser.add_argument("--zipf", type=float, default=1.1,
+                        help="exponent of the Zipf distribution")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generator = SocialMediaGenerator.from_likes(args.likes, zipf_s=args.zipf,
+                                                seed=args.seed)
+    generator.n_users = args.users or generator.n_users
+    generator.n_posts = args.posts or generator.n_posts
+    generator.n_comments = args.comments or generator.n_comments
+
+    with ConnectionPool(args.database, size=1) as pool:
+        generator.load(pool, verbose=True)
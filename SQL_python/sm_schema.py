@@ -0,0 +1,100 @@
+# Schema and queries of sm_app.sqlite, as used in sql_python.py,
+# for the modules that work on the same database
+
+#################
+# Create tables #
+#################
+
+create_users_table = """
+CREATE TABLE IF NOT EXISTS users (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT NOT NULL,
+  age INTEGER,
+  gender TEXT,
+  nationality TEXT
+);
+"""
+
+create_posts_table = """
+CREATE TABLE IF NOT EXISTS posts(
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  title TEXT NOT NULL,
+  description TEXT NOT NULL,
+  user_id INTEGER NOT NULL,
+  FOREIGN KEY (user_id) REFERENCES users (id)
+);
+"""
+
+create_comments_table = """
+CREATE TABLE IF NOT EXISTS comments (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  text TEXT NOT NULL,
+  user_id INTEGER NOT NULL,
+  post_id INTEGER NOT NULL,
+  FOREIGN KEY (user_id) REFERENCES users (id) FOREIGN KEY (post_id) REFERENCES posts (id)
+);
+"""
+
+create_likes_table = """
+CREATE TABLE IF NOT EXISTS likes (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  post_id integer NOT NULL,
+  FOREIGN KEY (user_id) REFERENCES users (id) FOREIGN KEY (post_id) REFERENCES posts (id)
+);
+"""
+
+create_tables = [
+    create_users_table,
+    create_posts_table,
+    create_comments_table,
+    create_likes_table,
+]
+
+# Columns filled in by the inserts (id is generated by SQLite)
+columns = {
+    "users": ("name", "age", "gender", "nationality"),
+    "posts": ("title", "description", "user_id"),
+    "comments": ("text", "user_id", "post_id"),
+    "likes": ("user_id", "post_id"),
+}
+
+#############
+# Read data #
+#############
+
+# returns all posts, along with the comments on the posts
+# and the names of the users who posted the comments
+select_posts_comments_users = """
+SELECT
+  posts.description as post,
+  text as comment,
+  name
+FROM
+  posts
+  INNER JOIN comments ON posts.id = comments.post_id
+  INNER JOIN users ON users.id = comments.user_id
+"""
+
+# Returns the post, along with the total number of likes that the post received
+select_post_likes = """
+SELECT
+  description as Post,
+  COUNT(likes.id) as Likes
+FROM
+  posts
+  LEFT JOIN likes ON posts.id = likes.post_id
+GROUP BY
+  likes.post_id
+"""
+
+# Registered queries, e.g. for index_advisor.py
+queries = {
+    "select_posts_comments_users": select_posts_comments_users,
+    "select_post_likes": select_post_likes,
+}
+
+
+def create_schema(connection):
+    for query in create_tables:
+        connection.execute(query)
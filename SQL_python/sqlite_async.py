@@ -0,0 +1,148 @@
+# Asyncio counterpart to execute_query / execute_read_query in sql_python.py
+#
+# sqlite3 calls block, so every query runs in a worker thread and the event
+# loop only awaits the result:
+# - reads go to a pool of reader threads, so several reads can run at the
+#   same time (the database is in WAL mode, see sqlite_pool.py)
+# - writes go to a single writer thread, which works through them one at a
+#   time in the order they were submitted; SQLite only allows one writer
+#   anyway, so this avoids threads waiting on the database lock
+# The writer has its own connection, so open iter_batches streams (which
+# keep a reader connection between batches) never hold up the writes. More
+# streams open at the same time than there are readers wait for a
+# connection, and fail after the pool timeout.
+#
+# Source:
+# https://docs.python.org/3/library/asyncio-eventloop.html#executing-code-in-thread-or-process-pools
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from sqlite_pool import ConnectionPool
+
+
+class AsyncDatabase:
+
+    def __init__(self, path, readers=4, **pool_options):
+        self.path = path
+        self.pool = ConnectionPool(path, size=readers, **pool_options)
+        self.write_pool = ConnectionPool(path, size=1, **pool_options)
+        self._readers = ThreadPoolExecutor(max_workers=readers,
+                                           thread_name_prefix="sqlite-reader")
+        self._writer = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix="sqlite-writer")
+
+    async def _run(self, executor, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(function, *args))
+
+    #########
+    # Reads #
+    #########
+
+    async def read_query(self, query, parameters=()):
+        return await self._run(self._readers, self.pool.read_query,
+                               query, parameters)
+
+    # Run several read queries concurrently, results are returned in the
+    # same order as the queries.
+    # Queries are either a query string or a (query, parameters) tuple.
+    async def read_queries(self, queries):
+        queries = [(x, ()) if isinstance(x, str) else x for x in queries]
+        return await asyncio.gather(
+            *[self.read_query(query, parameters) for query, parameters in queries]
+        )
+
+    # Stream the result of a query in lists of at most fetch_size rows.
+    # Each batch is fetched in a reader thread, the event loop is free
+    # between batches.
+    async def iter_batches(self, query, parameters=(), fetch_size=1000):
+        batches = self.pool.iter_batches(query, parameters, fetch_size)
+        try:
+            while True:
+                rows = await self._run(self._readers, next, batches, None)
+                if rows is None:
+                    return
+                yield rows
+        finally:
+            await self._run(self._readers, batches.close)
+
+    ##########
+    # Writes #
+    ##########
+
+    async def execute_query(self, query, parameters=()):
+        return await self._run(self._writer, self.write_pool.execute,
+                               query, parameters)
+
+    async def executemany(self, query, seq_of_parameters, batch_size=50000):
+        return await self._run(self._writer, self.write_pool.executemany,
+                               query, seq_of_parameters, batch_size)
+
+    async def bulk_insert(self, table, columns, rows, batch_size=50000):
+        return await self._run(self._writer, self.write_pool.bulk_insert,
+                               table, columns, rows, batch_size)
+
+    # Run function(connection) in the writer thread inside one transaction,
+    # e.g. for a read-modify-write that has to be atomic
+    async def run_in_transaction(self, function):
+        def run():
+            with self.write_pool.transaction() as connection:
+                return function(connection)
+        return await self._run(self._writer, run)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        # Let queued queries finish before closing the connections
+        await loop.run_in_executor(None, self._readers.shutdown)
+        await loop.run_in_executor(None, self._writer.shutdown)
+        self.pool.close()
+        self.write_pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+if __name__ == "__main__":
+
+    # Queries from sql_python.py
+    select_posts_comments_users = """
+    SELECT
+      posts.description as post,
+      text as comment,
+      name
+    FROM
+      posts
+      INNER JOIN comments ON posts.id = comments.post_id
+      INNER JOIN users ON users.id = comments.user_id
+    """
+
+    select_post_likes = """
+    SELECT
+      description as Post,
+      COUNT(likes.id) as Likes
+    FROM
+      posts
+      LEFT JOIN likes ON posts.id = likes.post_id
+    GROUP BY
+      likes.post_id
+    """
+
+    async def main():
+        async with AsyncDatabase("sm_app.sqlite", wal=False) as db:
+            posts_comments_users, post_likes = await db.read_queries(
+                [select_posts_comments_users, select_post_likes]
+            )
+            for row in posts_comments_users:
+                print(row)
+            for row in post_likes:
+                print(row)
+
+            async for rows in db.iter_batches("SELECT * FROM users", fetch_size=2):
+                print(rows)
+
+    asyncio.run(main())
@@ -0,0 +1,235 @@
+# Pooled, batched access layer for SQLite databases such as sm_app.sqlite
+#
+# Compared to create_connection / execute_query / execute_read_query in
+# sql_python.py this module
+# - keeps a fixed number of open connections instead of one per call
+# - puts the database in WAL mode, so readers don't block the writer
+# - groups writes in explicit transactions instead of committing every statement
+# - bulk inserts rows with executemany, in batches of a fixed size
+# - streams read results with fetchmany instead of fetchall
+#
+# Sources:
+# https://docs.python.org/3/library/sqlite3.html
+# https://www.sqlite.org/wal.html
+
+import sqlite3
+import queue
+import threading
+import itertools
+from contextlib import contextmanager
+from functools import lru_cache
+
+###########
+# Helpers #
+###########
+
+# Quote an identifier (table or column name) so it can be used in a query
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# Build the parameterized INSERT statement once per table/column combination.
+# Because the query text is always the same, sqlite3 can reuse its prepared
+# statement from the connection's statement cache.
+@lru_cache(maxsize=128)
+def insert_statement(table, columns):
+    column_list = ", ".join(quote_identifier(x) for x in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    return (f"INSERT INTO {quote_identifier(table)} ({column_list}) "
+            f"VALUES ({placeholders})")
+
+
+# Split an iterable of rows into lists of at most batch_size rows
+def batched(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+###################
+# Connection pool #
+###################
+
+class ConnectionPool:
+
+    def __init__(self, path, size=4, timeout=30.0, cached_statements=256,
+                 wal=True, synchronous="NORMAL"):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.wal = wal
+        self.synchronous = synchronous
+        self._connections = queue.LifoQueue(maxsize=size)
+        self._all_connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        # isolation_level=None: sqlite3 doesn't open transactions implicitly,
+        # transaction() below starts and ends them explicitly
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        if self.wal:
+            connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"PRAGMA synchronous={self.synchronous}")
+        return connection
+
+    # Take a connection from the pool, open a new one while the pool is not
+    # full yet, and otherwise wait until another thread returns one (at most
+    # timeout seconds)
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all_connections) < self.size:
+                connection = self._connect()
+                self._all_connections.append(connection)
+                return connection
+        try:
+            return self._connections.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"No connection available in the pool after {self.timeout} s"
+            ) from None
+
+    def _release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        self._connections.put(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            self._release(connection)
+
+    # Run a block of statements in one transaction: commit at the end,
+    # roll back if an exception occurs.
+    # BEGIN IMMEDIATE takes the write lock up front, so two writers can't
+    # both read first and then fail to upgrade their lock.
+    @contextmanager
+    def transaction(self, mode="IMMEDIATE"):
+        with self.connection() as connection:
+            connection.execute(f"BEGIN {mode}")
+            try:
+                yield connection
+            except BaseException:
+                connection.rollback()
+                raise
+            else:
+                connection.commit()
+
+    ##########
+    # Writes #
+    ##########
+
+    def execute(self, query, parameters=()):
+        with self.transaction() as connection:
+            cursor = connection.execute(query, parameters)
+            return cursor.rowcount
+
+    # Execute the same parameterized query for many parameter tuples,
+    # committing once per batch instead of once per row
+    def executemany(self, query, seq_of_parameters, batch_size=50000):
+        rowcount = 0
+        for batch in batched(seq_of_parameters, batch_size):
+            with self.transaction() as connection:
+                connection.executemany(query, batch)
+            rowcount += len(batch)
+        return rowcount
+
+    # Insert rows (tuples in the order of columns) into a table.
+    # rows can be any iterable, e.g. a generator, so the full data set never
+    # has to be in memory at once.
+    def bulk_insert(self, table, columns, rows, batch_size=50000):
+        query = insert_statement(table, tuple(columns))
+        return self.executemany(query, rows, batch_size=batch_size)
+
+    def executescript(self, script):
+        with self.connection() as connection:
+            connection.executescript(script)
+
+    #########
+    # Reads #
+    #########
+
+    def read_query(self, query, parameters=()):
+        with self.connection() as connection:
+            return connection.execute(query, parameters).fetchall()
+
+    # Yield the result of a query in lists of at most fetch_size rows, so
+    # memory use doesn't depend on the size of the result.
+    # The connection stays checked out until the generator is exhausted or
+    # closed.
+    def iter_batches(self, query, parameters=(), fetch_size=1000):
+        with self.connection() as connection:
+            cursor = connection.execute(query, parameters)
+            try:
+                while True:
+                    rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        return
+                    yield rows
+            finally:
+                cursor.close()
+
+    # Same as iter_batches, but yield the rows one by one
+    def iter_query(self, query, parameters=(), fetch_size=1000):
+        for rows in self.iter_batches(query, parameters, fetch_size):
+            yield from rows
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            for connection in self._all_connections:
+                connection.close()
+            self._all_connections.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import time
+
+    path = os.path.join(tempfile.mkdtemp(), "sm_app_pool.sqlite")
+    pool = ConnectionPool(path)
+    pool.execute("""
+    CREATE TABLE IF NOT EXISTS likes (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id INTEGER NOT NULL,
+      post_id integer NOT NULL
+    );
+    """)
+
+    # Bulk insert generated likes
+    n_likes = 1000000
+    start = time.perf_counter()
+    likes = ((x % 1000 + 1, x % 6 + 1) for x in range(n_likes))
+    pool.bulk_insert("likes", ("user_id", "post_id"), likes)
+    print(f"Inserted {n_likes} likes in {time.perf_counter() - start:.2f} s")
+
+    # Stream the result of a query
+    for row in pool.iter_query("SELECT post_id, COUNT(*) FROM likes GROUP BY post_id"):
+        print(row)
+
+    pool.close()
@@ -0,0 +1,204 @@
+# Pre-aggregated cube of the gifts by year, month, campaign and gender
+#
+# campaigns.py sums the amounts of all gifts again for every view. The cube
+# keeps, for every combination of year, month, campaign and gender, the
+# sum, count, minimum and maximum of the amounts and a HyperLogLog sketch of
+# the donors. All of these can be combined, so any roll-up or slice, e.g.
+# totals by year and campaign or the number of distinct female donors per
+# campaign in 2007, is computed from the (few) cells instead of the gifts.
+# New gifts are added to the cells with append().
+#
+# Gifts of donors that are not in donors.txt get gender 'unknown'.
+#
+# Usage:
+# cube = CampaignCube.from_frames(gifts, donors)
+# cube.query(by=['year', 'campaign'])
+# cube.query(by=['campaign'], where={'gender': 'F', 'year': 2007})
+# cube.append(new_gifts, donors)
+# cube.save('data/cube.npz')
+#
+# Sources:
+# https://en.wikipedia.org/wiki/OLAP_cube
+# http://algo.inria.fr/flajolet/Publications/FlFuGaMe07.pdf (HyperLogLog)
+
+import numpy as np
+import pandas as pd
+
+dimensions = ['year', 'month', 'campaign', 'gender']
+
+###############
+# HyperLogLog #
+###############
+
+# 64-bit hash of integer ids (splitmix64 finalizer), vectorized
+def hash_ids(ids):
+    x = np.asarray(ids).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> np.uint64(31))
+    return x
+
+
+# Number of bits needed for each value (exact, also for values above 2^53)
+def bit_length(x):
+    high = (x >> np.uint64(32)).astype(np.float64)
+    low = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+
+# Register and value of every id: the first p bits of the hash choose the
+# register, the value is the position of the first 1 bit in the other bits
+def hll_registers(ids, precision):
+    hashes = hash_ids(ids)
+    register = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes << np.uint64(precision)
+    value = np.where(rest == 0, 64 - precision + 1, 65 - bit_length(rest))
+    return register, value.astype(np.uint8)
+
+
+def hll_estimate(registers):
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(2.0 ** -registers.astype(np.float64), axis=-1)
+    zeros = np.sum(registers == 0, axis=-1)
+    # Small range correction: linear counting
+    small = (estimate <= 2.5 * m) & (zeros > 0)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where(small, linear, estimate)
+
+########
+# Cube #
+########
+
+class CampaignCube:
+
+    def __init__(self, precision=10):
+        self.precision = precision
+        self.keys = []
+        self._rows = {}
+        self.sum = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.min = np.zeros(0, dtype=np.int64)
+        self.max = np.zeros(0, dtype=np.int64)
+        self.registers = np.zeros((0, 1 << precision), dtype=np.uint8)
+
+    @classmethod
+    def from_frames(cls, gifts, donors, precision=10):
+        cube = cls(precision)
+        cube.append(gifts, donors)
+        return cube
+
+    # Cube of the Parquet cache (see campaign_cache.py)
+    @classmethod
+    def from_cache(cls, precision=10):
+        from campaign_cache import read_gifts, read_donors
+        return cls.from_frames(
+            read_gifts(columns=['donor_id', 'date', 'amount', 'campaign']),
+            read_donors(columns=['donor_id', 'gender']),
+            precision,
+        )
+
+    # Row of every cell key, new cells are added with empty measures
+    def _cell_rows(self, keys):
+        new = [x for x in keys if x not in self._rows]
+        if new:
+            for key in new:
+                self._rows[key] = len(self.keys)
+                self.keys.append(key)
+            n = len(new)
+            self.sum = np.concatenate([self.sum, np.zeros(n, dtype=np.int64)])
+            self.count = np.concatenate([self.count, np.zeros(n, dtype=np.int64)])
+            self.min = np.concatenate([self.min, np.full(n, np.iinfo(np.int64).max)])
+            self.max = np.concatenate([self.max, np.full(n, np.iinfo(np.int64).min)])
+            self.registers = np.concatenate(
+                [self.registers, np.zeros((n, self.registers.shape[1]), dtype=np.uint8)])
+        return np.array([self._rows[x] for x in keys], dtype=np.int64)
+
+    # Add gifts (donor_id, date, amount, campaign) to the cube.
+    # donors (donor_id, gender) gives the gender of the donors.
+    def append(self, gifts, donors):
+        gender = donors.set_index('donor_id')['gender'].astype(object)
+        dates = pd.to_datetime(gifts['date'])
+        batch = pd.DataFrame({
+            'year': dates.dt.year.to_numpy(),
+            'month': dates.dt.month.to_numpy(),
+            'campaign': gifts['campaign'].astype(object).to_numpy(),
+            'gender': gifts['donor_id'].map(gender).fillna('unknown').to_numpy(),
+            'amount': gifts['amount'].to_numpy(np.int64),
+            'donor_id': gifts['donor_id'].to_numpy(),
+        })
+        if batch.empty:
+            return self
+
+        grouped = batch.groupby(dimensions, sort=False)
+        cells = grouped['amount'].agg(['sum', 'count', 'min', 'max'])
+        rows = self._cell_rows(list(cells.index))
+        self.sum[rows] += cells['sum'].to_numpy()
+        self.count[rows] += cells['count'].to_numpy()
+        self.min[rows] = np.minimum(self.min[rows], cells['min'].to_numpy())
+        self.max[rows] = np.maximum(self.max[rows], cells['max'].to_numpy())
+
+        # Cell row of every gift, to update the donor sketches
+        gift_rows = rows[grouped.ngroup().to_numpy()]
+        register, value = hll_registers(batch['donor_id'].to_numpy(), self.precision)
+        np.maximum.at(self.registers, (gift_rows, register), value)
+        return self
+
+    # The cells as a DataFrame, with a column 'row' that points to the sketches
+    def cells(self):
+        frame = pd.DataFrame(self.keys, columns=dimensions)
+        frame['sum'] = self.sum
+        frame['count'] = self.count
+        frame['min'] = self.min
+        frame['max'] = self.max
+        frame['row'] = np.arange(len(self.keys))
+        return frame
+
+    # Measures rolled up to the dimensions in 'by', for the cells that match
+    # 'where' (a dict dimension -> value or list of values)
+    def query(self, by=(), where=None):
+        cells = self.cells()
+        for dimension, values in (where or {}).items():
+            if np.isscalar(values):
+                values = [values]
+            cells = cells[cells[dimension].isin(values)]
+
+        by = list(by)
+        if not by:
+            cells = cells.assign(total='total')
+            by = ['total']
+        grouped = cells.groupby(by)
+        result = grouped.agg(sum=('sum', 'sum'), count=('count', 'sum'),
+                             min=('min', 'min'), max=('max', 'max'))
+        result['mean'] = result['sum'] / result['count']
+        rows = cells['row'].to_numpy()
+        merged = np.array([self.registers[rows[grouped.indices[x]]].max(axis=0)
+                           for x in result.index], dtype=np.uint8)
+        if len(merged):
+            result['distinct_donors'] = np.round(hll_estimate(merged)).astype(np.int64)
+        else:
+            result['distinct_donors'] = pd.Series(dtype=np.int64)
+        return result.reset_index()
+
+    def save(self, path):
+        keys = pd.DataFrame(self.keys, columns=dimensions)
+        np.savez_compressed(
+            path, precision=self.precision,
+            year=keys['year'].to_numpy(np.int64), month=keys['month'].to_numpy(np.int64),
+            campaign=keys['campaign'].to_numpy(str), gender=keys['gender'].to_numpy(str),
+            sum=self.sum, count=self.count, min=self.min, max=self.max,
+            registers=self.registers,
+        )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        cube = cls(int(data['precision']))
+        cube.keys = list(zip(data['year'].tolist(), data['month'].tolist(),
+                             data['campaign'].tolist(), data['gender'].tolist()))
+        cube._rows = {x: i for i, x in enumerate(cube.keys)}
+        for name in ('sum', 'count', 'min', 'max', 'registers'):
+            setattr(cube, name, data[name])
+        return cube
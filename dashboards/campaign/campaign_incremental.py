@@ -0,0 +1,182 @@
+# Incremental refresh of the campaign aggregates
+#
+# gifts.txt only grows: new gifts are appended with a higher transaction_id.
+# Instead of aggregating all gifts again, the aggregator keeps its state on
+# disk (the cube of campaign_cube.py) together with
+# - the highest transaction_id it has seen (the high-water mark)
+# - how far it has read gifts.txt and donors.txt (byte offsets)
+# - the donors it knows (donor_id and gender)
+# On refresh() only the lines appended to gifts.txt and donors.txt since the
+# previous refresh are read, so a refresh costs O(new rows).
+#
+# Gifts of donors that are not in donors.txt yet are kept apart (pending)
+# and added to the cube once the donor appears. Until then they count as
+# gender 'unknown' in the query results, as with the left join in
+# campaigns.py.
+#
+# If a file is shorter than what was read before, or its new rows don't
+# continue after the high-water mark, it was rewritten and everything is
+# aggregated again. Donors can also be corrected in place (e.g. a gender),
+# which keeps the size: the aggregator keeps the modification time of
+# donors.txt and a hash of the part it has read, and when the file was
+# modified and that part changed, everything is aggregated again too.
+#
+# Usage:
+# aggregator = IncrementalAggregator('data/aggregates')
+# aggregator.refresh()
+# aggregator.query(by=['year', 'campaign'])
+
+import io
+import os
+import json
+import copy
+import hashlib
+
+import pandas as pd
+
+from campaign_cube import CampaignCube
+
+gifts_txt = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gifts.txt')
+donors_txt = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'donors.txt')
+
+gift_columns = ['transaction_id', 'donor_id', 'date', 'amount', 'campaign']
+
+
+# Lines appended to a tab-separated file after byte offset 'start', as a
+# DataFrame, and the offset of the end of the last complete line.
+# A last line without a line end may still be being written, it is left for
+# the next refresh.
+def read_appended(path, start):
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = max(start, f.tell())
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    columns = header.decode('utf-8').rstrip('\r\n').split('\t')
+    if end == 0:
+        return pd.DataFrame(columns=columns), start
+    frame = pd.read_csv(io.BytesIO(data[:end]), sep='\t', header=None, names=columns)
+    return frame, start + end
+
+
+# Hash of the first 'size' bytes of a file
+def prefix_hash(path, size, block_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while size > 0:
+            block = f.read(min(block_size, size))
+            if not block:
+                break
+            sha.update(block)
+            size -= len(block)
+    return sha.hexdigest()
+
+
+class IncrementalAggregator:
+
+    def __init__(self, directory='data/aggregates', gifts_path=gifts_txt,
+                 donors_path=donors_txt, precision=10):
+        self.directory = directory
+        self.gifts_path = gifts_path
+        self.donors_path = donors_path
+        self.precision = precision
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._path('state.json')):
+            self._load()
+        else:
+            self._reset()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _reset(self):
+        self.state = {'high_water_mark': 0, 'gifts_offset': 0, 'donors_offset': 0}
+        self.cube = CampaignCube(self.precision)
+        self.donors = pd.DataFrame({'donor_id': pd.Series(dtype='int64'),
+                                    'gender': pd.Series(dtype=object)})
+        self.pending = pd.DataFrame(columns=gift_columns)
+
+    def _load(self):
+        with open(self._path('state.json')) as f:
+            self.state = json.load(f)
+        self.cube = CampaignCube.load(self._path('cube.npz'))
+        self.donors = pd.read_parquet(self._path('donors.parquet'))
+        self.pending = pd.read_parquet(self._path('pending.parquet'))
+
+    # Write the new state next to the old one, and swap in the state file
+    # last, so an interrupted save leaves the previous state intact
+    def _save(self):
+        self.cube.save(self._path('cube.tmp.npz'))
+        self.donors.to_parquet(self._path('donors.tmp.parquet'), index=False)
+        self.pending.to_parquet(self._path('pending.tmp.parquet'), index=False)
+        os.replace(self._path('cube.tmp.npz'), self._path('cube.npz'))
+        os.replace(self._path('donors.tmp.parquet'), self._path('donors.parquet'))
+        os.replace(self._path('pending.tmp.parquet'), self._path('pending.parquet'))
+        with open(self._path('state.tmp.json'), 'w') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(self._path('state.tmp.json'), self._path('state.json'))
+
+    def _rewritten(self):
+        return (os.path.getsize(self.gifts_path) < self.state['gifts_offset']
+                or os.path.getsize(self.donors_path) < self.state['donors_offset']
+                or self._donors_changed())
+
+    # The donors that were read already changed in place (an append only
+    # changes the modification time)
+    def _donors_changed(self):
+        if os.stat(self.donors_path).st_mtime_ns == self.state.get('donors_mtime_ns'):
+            return False
+        return (prefix_hash(self.donors_path, self.state['donors_offset'])
+                != self.state.get('donors_hash'))
+
+    # Read the new donors and gifts and add them to the aggregates.
+    # Returns the number of new gifts, new donors and pending gifts that
+    # were resolved.
+    def refresh(self):
+        if self._rewritten():
+            self._reset()
+
+        donors_mtime_ns = os.stat(self.donors_path).st_mtime_ns
+        new_donors, donors_offset = read_appended(self.donors_path,
+                                                  self.state['donors_offset'])
+        new_gifts, gifts_offset = read_appended(self.gifts_path,
+                                                self.state['gifts_offset'])
+        if len(new_gifts) and new_gifts['transaction_id'].min() <= self.state['high_water_mark']:
+            # Not an append: aggregate everything again
+            self._reset()
+            return self.refresh()
+
+        if len(new_donors):
+            self.donors = pd.concat(
+                [self.donors, new_donors[['donor_id', 'gender']].astype({'gender': object})],
+                ignore_index=True,
+            ).drop_duplicates('donor_id', keep='last')
+
+        # Gifts of known donors go to the cube, the others wait
+        candidates = pd.concat([self.pending, new_gifts[gift_columns]], ignore_index=True)
+        known = candidates['donor_id'].isin(self.donors['donor_id'])
+        self.cube.append(candidates[known], self.donors)
+        resolved = int(known[:len(self.pending)].sum())
+        self.pending = candidates[~known].reset_index(drop=True)
+
+        if len(new_gifts):
+            self.state['high_water_mark'] = int(new_gifts['transaction_id'].max())
+        self.state['gifts_offset'] = gifts_offset
+        if len(new_donors) or 'donors_hash' not in self.state:
+            self.state['donors_hash'] = prefix_hash(self.donors_path, donors_offset)
+        self.state['donors_offset'] = donors_offset
+        self.state['donors_mtime_ns'] = donors_mtime_ns
+        self._save()
+        return {'new_gifts': len(new_gifts), 'new_donors': len(new_donors),
+                'resolved_pending': resolved}
+
+    # The cube including the pending gifts (gender 'unknown'). The pending
+    # gifts are added to a copy, the stored cube stays as it is.
+    def current_cube(self):
+        if self.pending.empty:
+            return self.cube
+        return copy.deepcopy(self.cube).append(self.pending, self.donors)
+
+    def query(self, by=(), where=None):
+        return self.current_cube().query(by=by, where=where)
@@ -0,0 +1,61 @@
+# Streaming aggregation of the gifts, for gift files that don't fit in memory
+#
+# campaigns.py reads all gifts and donors, merges them and then sums the
+# amounts by year and campaign and by gender and campaign. Here the gifts are
+# read in chunks. Every chunk is joined with the donors through a lookup on
+# donor_id (the donors are small, they stay in memory), and its sums are added
+# to the running totals. Peak memory is the donors plus one chunk.
+#
+# Usage:
+# sum_year_campaign, sum_gender_campaign = stream_campaign_sums(
+#     "data/gifts.txt", "data/donors.txt")
+
+import pandas as pd
+
+
+# Gender per donor, as a Series indexed by donor_id
+def read_donor_gender(donors_path):
+    donors = pd.read_csv(donors_path, sep='\t', usecols=['donor_id', 'gender'])
+    return donors.set_index('donor_id')['gender']
+
+
+def read_gift_chunks(gifts_path, chunksize=100000):
+    return pd.read_csv(gifts_path, sep='\t',
+                       usecols=['donor_id', 'date', 'amount', 'campaign'],
+                       chunksize=chunksize)
+
+
+# Add the sums of a chunk to the running totals
+def add_sums(total, part):
+    if total is None:
+        return part
+    return total.add(part, fill_value=0)
+
+
+# Same results as sum_year_campaign and sum_gender_campaign in campaigns.py.
+# As with the left join there, gifts of unknown donors count for the year
+# totals, but not for the gender totals.
+def stream_campaign_sums(gifts_path, donors_path, chunksize=100000):
+    gender = read_donor_gender(donors_path)
+    sum_year_campaign = None
+    sum_gender_campaign = None
+    amount_dtype = 'int64'
+    for chunk in read_gift_chunks(gifts_path, chunksize):
+        # The dates are yyyy-mm-dd, only the year is needed
+        chunk['year'] = pd.to_datetime(chunk['date'], format='%Y-%m-%d').dt.year
+        chunk['gender'] = chunk['donor_id'].map(gender)
+        sum_year_campaign = add_sums(
+            sum_year_campaign, chunk.groupby(['year', 'campaign'])['amount'].sum())
+        sum_gender_campaign = add_sums(
+            sum_gender_campaign, chunk.groupby(['gender', 'campaign'])['amount'].sum())
+        amount_dtype = chunk['amount'].dtype
+
+    return (to_frame(sum_year_campaign, ['year', 'campaign'], amount_dtype),
+            to_frame(sum_gender_campaign, ['gender', 'campaign'], amount_dtype))
+
+
+# add() with fill_value turns integer sums into floats, turn them back
+def to_frame(sums, keys, amount_dtype):
+    if sums is None:
+        return pd.DataFrame(columns=keys + ['amount'])
+    return sums.astype(amount_dtype).rename('amount').reset_index()
@@ -2,32 +2,66 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+from campaign_stream import stream_campaign_sums
+from campaign_cache import read_gifts, read_donors
+from campaign_cube import CampaignCube
+from campaign_incremental import IncrementalAggregator
+
 
 # Set style of seaborn plots
 sns.set(style="darkgrid")
 
-# Read in the data
-gift = pd.read_csv("data/gifts.txt", sep='\t', parse_dates=['date'])
-persoons = pd.read_csv("data/donors.txt", sep='\t')
+# Read the gifts in chunks instead of all at once, for gift files that
+# don't fit in memory (see campaign_stream.py)
+streaming = False
+# Read the data from the Parquet cache instead of the text files
+# (see campaign_cache.py)
+use_cache = True
+
+if streaming:
+    sum_year_campaign, sum_gender_campaign = stream_campaign_sums(
+        "data/gifts.txt", "data/donors.txt", chunksize=100000)
+else:
+    # Read in the data
+    if use_cache:
+        gift = read_gifts(columns=['donor_id', 'date', 'amount', 'campaign'])
+        persoons = read_donors(columns=['donor_id', 'gender'])
+    else:
+        gift = pd.read_csv("data/gifts.txt", sep='\t', parse_dates=['date'])
+        persoons = pd.read_csv("data/donors.txt", sep='\t')
+
+    # Left join of the data
+    df = pd.merge(gift, persoons, how='left', on=['donor_id'])
+    df['year'] = df['date'].dt.year
+    df.dtypes
 
-# Left join of the data
-df = pd.merge(gift, persoons, how='left', on=['donor_id'])
-df['year'] = df['date'].dt.year
-df.dtypes
+    # Aggregate by year and campaign, and by gender and campaign
+    # (observed=True: only the combinations that occur, also for categoricals)
+    groupby_year_campaign = df.groupby(['year','campaign'], observed=True)
+    sum_year_campaign = groupby_year_campaign[['amount']].sum().reset_index()
+    groupby_gender_campaign = df.groupby(['gender','campaign'], observed=True)
+    sum_gender_campaign = groupby_gender_campaign[['amount']].sum().reset_index()
 
-# Aggregate by year and campaign, and make line plot
-groupby_year_campaign = df.groupby(['year','campaign'])
-sum_year_campaign = groupby_year_campaign[['amount']].sum().reset_index()
+# Line plot by year and campaign
 plot1 = sns.pointplot(x='year', y='amount', hue='campaign',
                       data=sum_year_campaign)
 plt.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
 
-# Aggregate by gender and campaign, and make bar plot
-groupby_gender_campaign = df.groupby(['gender','campaign'])
-sum_gender_campaign = groupby_gender_campaign[['amount']].sum().reset_index()
+# Bar plot by gender and campaign
 plot2 = sns.catplot(x='campaign', y='amount', hue='gender',
                        data=sum_gender_campaign, kind='bar', height=4, aspect=2)
 plot2.set_xticklabels(rotation=45)
 sum_gender_campaign
 
 plt.show()
+
+# Any other roll-up or slice from the pre-aggregated cube (see campaign_cube.py)
+cube = CampaignCube.from_cache()
+cube.query(by=['year', 'month'])
+cube.query(by=['campaign'], where={'gender': 'F', 'year': 2007})
+
+# The same cube kept up to date on disk: refresh() only reads the gifts and
+# donors appended since the previous refresh (see campaign_incremental.py)
+aggregator = IncrementalAggregator('data/aggregates')
+aggregator.refresh()
+aggregator.query(by=['gender', 'campaign'])
@@ -1,6 +1,8 @@
 import dash
 import dash_bootstrap_components as dbc
 
+from metrics import register_metrics_route
+
 app = dash.Dash(
     external_stylesheets=[dbc.themes.BOOTSTRAP],
     # these meta_tags ensure content is scaled correctly on different devices
@@ -11,4 +13,7 @@ app = dash.Dash(
 )
 
 server = app.server
-app.config.suppress_callback_exceptions = True
\ No newline at end of file
+app.config.suppress_callback_exceptions = True
+
+# Metrics of the callbacks decorated with metrics.instrument, as JSON
+register_metrics_route(server)
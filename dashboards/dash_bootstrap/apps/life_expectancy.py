@@ -1,12 +1,17 @@
+import math
+from functools import lru_cache
+
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output
 
-import pandas as pd
-
 from app import app
+import datasets
+from downsample import view_from_relayout, downsample_scatter, density_trace
+from metrics import instrument
+from shared_cache import memoize
 
-df = pd.read_csv('https://raw.githubusercontent.com/plotly/datasets/master/gapminderDataFiveYear.csv')
+df = datasets.get('gapminder')
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
@@ -23,33 +28,45 @@ layout = html.Div([
 ])
 
 
-@app.callback(
-    Output('graph-with-slider', 'figure'),
-    [Input('year-slider', 'value')])
-def update_figure(selected_year):
-    filtered_df = df[df.year == selected_year]
-    traces = []
-    for i in filtered_df.continent.unique():
-        df_by_continent = filtered_df[filtered_df['continent'] == i]
+# Most points drawn per figure, for more points in view the figure shows
+# their density and a sample (see downsample.py)
+max_points = 2000
+
+
+# The figure of a year, for the full range or zoomed in on a view (see
+# downsample.view_from_relayout). The data of the year is split by
+# continent with one groupby instead of filtering for every continent.
+def build_figure(df, year, view=None):
+    df_year = df[df.year == year]
+    indices, density = downsample_scatter(df_year['gdpPercap'], df_year['lifeExp'], view,
+                                          max_points=max_points, log_x=True)
+    traces = [density_trace(density)] if density is not None else []
+    for continent, df_by_continent in df_year.iloc[indices].groupby('continent', sort=False):
         traces.append(dict(
-            x=df_by_continent['gdpPercap'],
-            y=df_by_continent['lifeExp'],
-            text=df_by_continent['country'],
+            x=df_by_continent['gdpPercap'].tolist(),
+            y=df_by_continent['lifeExp'].tolist(),
+            text=df_by_continent['country'].tolist(),
             mode='markers',
             opacity=0.7,
             marker={
                 'size': 15,
                 'line': {'width': 0.5, 'color': 'white'}
             },
-            name=i
+            name=continent
         ))
 
+    x_range = [2.3, 4.8]
+    y_range = [20, 90]
+    if view and 'x' in view:
+        x_range = [math.log10(x) for x in view['x']]
+    if view and 'y' in view:
+        y_range = list(view['y'])
     return {
         'data': traces,
         'layout': dict(
             xaxis={'type': 'log', 'title': 'GDP Per Capita',
-                   'range':[2.3, 4.8]},
-            yaxis={'title': 'Life Expectancy', 'range': [20, 90]},
+                   'range': x_range},
+            yaxis={'title': 'Life Expectancy', 'range': y_range},
             margin={'l': 40, 'b': 40, 't': 10, 'r': 10},
             legend={'x': 0, 'y': 1},
             hovermode='closest',
@@ -57,3 +74,52 @@ def update_figure(selected_year):
         )
     }
 
+
+# There are only a few years (every 5 years), so the figures of all years are
+# built at start-up and the callback only looks them up. Other values (the
+# slider only sends years from its marks) and zoomed in views are built on
+# demand and kept in a bounded cache, in the process and shared with the
+# other worker processes (see shared_cache.py). The figures and the caches
+# are rebuilt when the dataset is refreshed.
+def build_figures(df):
+    return {year: build_figure(df, year) for year in df['year'].unique().tolist()}
+
+
+figures = build_figures(df)
+
+
+@lru_cache(maxsize=256)
+@memoize(ttl=3600, version=lambda: datasets.version('gapminder'))
+def figure_for(year, view=None):
+    return build_figure(df, year, view and dict(view))
+
+
+def update_data(new_df):
+    global df, figures
+    df, figures = new_df, build_figures(new_df)
+    figure_for.__wrapped__.cache_clear()
+    figure_for.cache_clear()
+
+
+datasets.on_refresh('gapminder', update_data)
+
+
+# The view is rounded, so small differences in zoom share a cached figure
+def rounded_view(relayout_data):
+    view = view_from_relayout(relayout_data, log_x=True)
+    if view is None:
+        return None
+    return tuple((axis, tuple(float('%.4g' % x) for x in view[axis])) for axis in sorted(view))
+
+
+@app.callback(
+    Output('graph-with-slider', 'figure'),
+    [Input('year-slider', 'value'),
+     Input('graph-with-slider', 'relayoutData')])
+@instrument('life_expectancy.update_figure')
+def update_figure(selected_year, relayout_data):
+    view = rounded_view(relayout_data)
+    figure = figures.get(selected_year) if view is None else None
+    if figure is None:
+        figure = figure_for(selected_year, view)
+    return figure
@@ -0,0 +1,135 @@
+# Registry of the datasets used by the apps
+#
+# The apps used to read their data from a URL when they were imported, so the
+# server could not start without network access. Here every dataset has a
+# local snapshot (a Parquet file in data/, committed with the code). get()
+# reads the snapshot. Only without a snapshot it downloads the data (and
+# writes the snapshot), and raises a DatasetError if that fails.
+#
+# refresh() downloads the data again and swaps in the new version, and
+# start_refresh() does so periodically in a background thread. If a download
+# fails, the current version is kept. Apps can react to a new version with
+# on_refresh(), e.g. to rebuild precomputed figures.
+#
+# Usage:
+# df = get('gapminder')
+# on_refresh('gapminder', rebuild_figures)
+# start_refresh(24 * 3600)
+#
+# Create or update all snapshots:
+# python datasets.py
+
+import os
+import logging
+import threading
+
+import pandas as pd
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetError(Exception):
+    pass
+
+
+class Dataset:
+
+    def __init__(self, name, url, reader=pd.read_csv, directory=data_dir):
+        self.name = name
+        self.url = url
+        self.reader = reader
+        self.path = os.path.join(directory, name + '.parquet')
+        self.listeners = []
+        self._frame = None
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        frame = self.reader(self.url)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+        return frame
+
+    # Modification time of the snapshot, changes with every refresh
+    def version(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def get(self):
+        with self._lock:
+            if self._frame is None:
+                if os.path.exists(self.path):
+                    self._frame = pd.read_parquet(self.path)
+                else:
+                    try:
+                        self._frame = self.fetch()
+                    except Exception as e:
+                        raise DatasetError(
+                            f'No snapshot of dataset {self.name} at {self.path}, and '
+                            f'downloading it failed ({e}). Run python datasets.py '
+                            'with network access to create it.') from e
+            return self._frame
+
+    # Download the data again. Returns True if there is a new version.
+    def refresh(self):
+        try:
+            frame = self.fetch()
+        except Exception:
+            logger.exception('Refresh of dataset %s failed', self.name)
+            return False
+        with self._lock:
+            self._frame = frame
+        for listener in self.listeners:
+            listener(frame)
+        return True
+
+
+registry = {}
+
+
+def register(name, url, reader=pd.read_csv):
+    registry[name] = Dataset(name, url, reader)
+    return registry[name]
+
+
+def get(name):
+    return registry[name].get()
+
+
+def version(name):
+    return registry[name].version()
+
+
+def on_refresh(name, listener):
+    registry[name].listeners.append(listener)
+
+
+def refresh_all():
+    return {name: x.refresh() for name, x in registry.items()}
+
+
+def start_refresh(interval):
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            refresh_all()
+
+    threading.Thread(target=run, name='dataset-refresh', daemon=True).start()
+    return stop
+
+############
+# Datasets #
+############
+
+register('gapminder', 'https://raw.githubusercontent.com/plotly/datasets/master/gapminderDataFiveYear.csv')
+
+
+if __name__ == '__main__':
+    for name, ok in refresh_all().items():
+        print(name, registry[name].path if ok else 'failed')
@@ -0,0 +1,118 @@
+# Downsampling of scatter plots for large datasets
+#
+# A scatter trace sends every point to the browser. For large datasets the
+# points in view are replaced by
+# - their density: counts on a bins x bins grid, drawn as a heatmap
+# - a representative sample of at most max_points points: one random point
+#   of every occupied grid cell (so outliers and sparse regions stay
+#   visible), topped up with random points from the dense cells
+# so the payload is bounded by max_points + bins * bins, whatever the size of
+# the data. When the user zooms, the graph's relayoutData gives the new view,
+# and the points in that view are downsampled again, at a higher resolution.
+#
+# Usage:
+# view = view_from_relayout(relayout_data, log_x=True)
+# indices, density = downsample_scatter(x, y, view, log_x=True)
+# traces = [density_trace(density)] + points of df.iloc[indices]
+
+import numpy as np
+
+
+# The axis ranges of a relayoutData of a graph, or None when the graph shows
+# the full range (no zoom, autorange or double click). Ranges of log axes
+# are given by plotly as log10, they are returned in data units.
+def view_from_relayout(relayout_data, log_x=False, log_y=False):
+    if not relayout_data:
+        return None
+    view = {}
+    for axis, log in (('x', log_x), ('y', log_y)):
+        try:
+            low = relayout_data[axis + 'axis.range[0]']
+            high = relayout_data[axis + 'axis.range[1]']
+        except KeyError:
+            continue
+        view[axis] = (10 ** low, 10 ** high) if log else (low, high)
+    return view or None
+
+
+def in_view(x, y, view):
+    mask = np.ones(len(x), dtype=bool)
+    if view:
+        if 'x' in view:
+            mask &= (x >= view['x'][0]) & (x <= view['x'][1])
+        if 'y' in view:
+            mask &= (y >= view['y'][0]) & (y <= view['y'][1])
+    return mask
+
+
+# Grid cell (0 .. bins * bins - 1) of every point. Log axes get log-spaced
+# cells, as drawn.
+def grid_cells(x, y, bins, log_x=False, log_y=False):
+    cells = np.zeros(len(x), dtype=np.int64)
+    edges = []
+    for values, log in ((x, log_x), (y, log_y)):
+        values = np.log10(values) if log else values
+        low, high = (values.min(), values.max()) if len(values) else (0, 1)
+        axis_edges = np.linspace(low, high if high > low else low + 1, bins + 1)
+        cell = np.clip(np.searchsorted(axis_edges, values, side='right') - 1, 0, bins - 1)
+        cells = cells * bins + cell
+        edges.append(10 ** axis_edges if log else axis_edges)
+    return cells, edges
+
+
+# Indices of at most max_points points: one random point of every occupied
+# cell first, then random points of the remaining ones
+def representative_sample(cells, max_points, rng):
+    order = rng.permutation(len(cells))
+    _, first = np.unique(cells[order], return_index=True)
+    one_per_cell = order[first]
+    if len(one_per_cell) >= max_points:
+        return np.sort(rng.choice(one_per_cell, max_points, replace=False))
+    rest = np.setdiff1d(order, one_per_cell, assume_unique=True)
+    extra = rng.choice(rest, min(max_points - len(one_per_cell), len(rest)), replace=False)
+    return np.sort(np.concatenate([one_per_cell, extra]))
+
+
+# Indices of the points to draw, and the density of the points in view
+# (None if all points in view are drawn)
+def downsample_scatter(x, y, view=None, max_points=2000, bins=64,
+                       log_x=False, log_y=False, seed=0):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    visible = np.flatnonzero(in_view(x, y, view))
+    if len(visible) <= max_points:
+        return visible, None
+
+    cells, (x_edges, y_edges) = grid_cells(x[visible], y[visible], bins, log_x, log_y)
+    rng = np.random.default_rng(seed)
+    sample = visible[representative_sample(cells, max_points, rng)]
+    counts = np.bincount(cells, minlength=bins * bins).reshape(bins, bins)
+    density = {
+        'x': centers(x_edges, log_x),
+        'y': centers(y_edges, log_y),
+        # z[row][column]: rows are y, columns are x
+        'z': counts.T,
+    }
+    return sample, density
+
+
+def centers(edges, log=False):
+    if log:
+        return np.sqrt(edges[:-1] * edges[1:])
+    return (edges[:-1] + edges[1:]) / 2
+
+
+# Heatmap trace of a density, empty cells are transparent
+def density_trace(density, name='density'):
+    z = np.where(density['z'] > 0, density['z'], np.nan)
+    return dict(
+        type='heatmap',
+        x=density['x'].tolist(),
+        y=density['y'].tolist(),
+        z=[[None if np.isnan(v) else int(v) for v in row] for row in z],
+        colorscale='Greys',
+        showscale=False,
+        opacity=0.5,
+        hoverinfo='z',
+        name=name,
+    )
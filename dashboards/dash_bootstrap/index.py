@@ -23,17 +23,22 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
 
+import os
 import importlib
-import glob
+import threading
 
-from app import app
+from flask import request
 
-# Get all the file names of the apps in the apps folder
-apps_names = [x.replace('apps\\', '').replace('.py', '') for x in glob.glob("apps/*.py")]
-apps_names.remove('__init__')
+from app import app, server
+import datasets
+from metrics import instrument, metrics
 
-# Import the apps in the apps folder
-apps_modules = [importlib.import_module('apps.' + x) for x in apps_names]
+# Get all the file names of the apps in the apps folder. The apps are
+# imported in a background thread after start-up (see load_apps), so the
+# server starts without waiting for the data of every app.
+apps_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'apps')
+apps_names = sorted(os.path.splitext(x)[0] for x in os.listdir(apps_dir)
+                    if x.endswith('.py') and not x.startswith('_'))
 
 # Create pages for navigation
 pages = [x.replace('_', ' ').title() for x in apps_names]
@@ -42,6 +47,50 @@ number_of_pages = len(pages)
 pages_url = ['/' + x.replace(' ', '-').lower() for x in pages]
 pages_url_id =  [x.replace(' ', '-').lower() + '-link' for x in pages]
 
+# Download the datasets again every refresh_interval seconds (None: never).
+# The refresh thread has to run in the process that serves the requests:
+# serve.py starts it in every worker after the fork (threads don't survive
+# a fork), index.py when it runs the development server.
+refresh_interval = None
+
+
+def start_refresh():
+    if refresh_interval:
+        datasets.start_refresh(refresh_interval)
+
+
+def load_app(name):
+    return importlib.import_module('apps.' + name)
+
+
+apps_loaded = threading.Event()
+
+
+def load_apps():
+    for name in apps_names:
+        load_app(name)
+    apps_loaded.set()
+
+
+# The browser asks for the callbacks once, when it loads the dashboard
+# (/_dash-dependencies), and navigates between the pages on the client
+# (dcc.Location) after that. So the callbacks of all apps must be registered
+# by then: the request waits until the apps are imported.
+@server.before_request
+def wait_for_apps():
+    if not apps_loaded.is_set() and request.path.endswith('/_dash-dependencies'):
+        load_apps()
+
+
+# Index of the page of a pathname, or None. Page 1 is the homepage / index.
+def page_index(pathname):
+    if pathname == '/':
+        return 0
+    if pathname in pages_url:
+        return pages_url.index(pathname)
+    return None
+
+
 # we use the Row and Col components to construct the sidebar header
 # it consists of a title, and a toggle, the latter is hidden on large screens
 sidebar_header = dbc.Row(
@@ -87,7 +136,7 @@ sidebar = html.Div(
         # use the Collapse component to animate hiding / revealing links
         dbc.Collapse(
             dbc.Nav(
-                [dbc.NavLink(pages[x], href=pages_url[x], id=pages_url_id[x]) 
+                [dbc.NavLink(pages[x], href=pages_url[x], id=pages_url_id[x])
                  for x in range(number_of_pages)
                 ],
                 vertical=True,
@@ -110,20 +159,45 @@ app.title = 'My dashboard'
     [Output(x, "active") for x in pages_url_id],
     [Input("url", "pathname")],
 )
+@instrument()
 def toggle_active_links(pathname):
-    if pathname == "/":
-        # Treat page 1 as the homepage / index
-        return True, False, False
-    return [pathname == pages_url[x] for x in pages_url]
+    index = page_index(pathname)
+    return [x == index for x in range(number_of_pages)]
+
+
+# Metrics of the callbacks (see metrics.py), on the /metrics page. The page
+# is not in the navigation.
+def metrics_table(header, rows):
+    return dbc.Table([html.Thead(html.Tr([html.Th(x) for x in header])),
+                      html.Tbody([html.Tr([html.Td(x) for x in row]) for row in rows])],
+                     bordered=True, size="sm")
+
+
+def metrics_page():
+    summary = metrics.summary()
+    columns = ['calls', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms',
+               'mean_payload_bytes', 'max_payload_bytes']
+    buckets = list(next(iter(summary.values()))['histogram_ms']) if summary else []
+    return html.Div([
+        html.H2("Callback metrics"),
+        metrics_table(['callback'] + columns,
+                      [[name] + [f"{x[column]:,.2f}" if isinstance(x[column], float)
+                                 else f"{x[column]:,}" for column in columns]
+                       for name, x in summary.items()]),
+        html.H4("Wall time histogram (calls per bucket, upper bound in ms)"),
+        metrics_table(['callback'] + buckets,
+                      [[name] + list(x['histogram_ms'].values()) for name, x in summary.items()]),
+    ])
 
 
 @app.callback(Output("page-content", "children"), [Input("url", "pathname")])
+@instrument()
 def render_page_content(pathname):
-    # Treat page 1 as the homepage / index
-    if pathname == '/':
-        return apps_modules[0].layout
-    elif any([pathname == x for x in pages_url]):
-        return apps_modules[pages_url.index(pathname)].layout
+    index = page_index(pathname)
+    if index is not None:
+        return load_app(apps_names[index]).layout
+    if pathname == "/metrics":
+        return metrics_page()
     # If the user tries to reach a different page, return a 404 message
     return dbc.Jumbotron(
         [
@@ -139,6 +213,7 @@ def render_page_content(pathname):
     [Input("toggle", "n_clicks")],
     [State("collapse", "is_open")],
 )
+@instrument()
 def toggle_collapse(n, is_open):
     if n:
         return not is_open
@@ -146,4 +221,6 @@ def toggle_collapse(n, is_open):
 
 # http://127.0.0.1:8888/
 if __name__ == "__main__":
+    threading.Thread(target=load_apps, name='load-apps', daemon=True).start()
+    start_refresh()
     app.run_server(port=8888, debug=False, dev_tools_hot_reload=False)
@@ -0,0 +1,149 @@
+# Load test for the dashboard
+#
+# Simulates users from several threads against a running server (index.py
+# or serve.py): they open pages (the page itself, the callback definitions
+# and the page content callback, as the browser does) and move the year
+# slider of the life expectancy page. Reports the requests per second, the
+# p50/p99 latency and the errors per kind of request, and exits with status 1
+# if any request failed.
+#
+# Usage:
+# python serve.py --workers 4
+# python load_test.py --url http://127.0.0.1:8888 --threads 16 --duration 30
+
+import sys
+import json
+import random
+import argparse
+import threading
+import time
+import urllib.request
+
+from metrics import percentile
+
+years = list(range(1952, 2008, 5))
+
+
+def get(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+# A callback request as sent by the Dash renderer
+def post_callback(url, output, inputs):
+    body = json.dumps({
+        'output': output,
+        'outputs': {'id': output.split('.')[0], 'property': output.split('.')[1]},
+        'inputs': inputs,
+        'changedPropIds': [x['id'] + '.' + x['property'] for x in inputs],
+    }).encode()
+    request = urllib.request.Request(url + '/_dash-update-component', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+############
+# Requests #
+############
+
+def page_navigation(url, rng):
+    path = rng.choice(['/life-expectancy', '/test-app'])
+    get(url + path)
+    get(url + '/_dash-layout')
+    get(url + '/_dash-dependencies')
+    post_callback(url, 'page-content.children',
+                  [{'id': 'url', 'property': 'pathname', 'value': path}])
+
+
+def slider_callback(url, rng):
+    post_callback(url, 'graph-with-slider.figure',
+                  [{'id': 'year-slider', 'property': 'value', 'value': rng.choice(years)},
+                   {'id': 'graph-with-slider', 'property': 'relayoutData', 'value': None}])
+
+
+requests = {
+    'page_navigation': page_navigation,
+    'slider_callback': slider_callback,
+}
+
+default_mix = {'page_navigation': 0.1, 'slider_callback': 0.9}
+
+
+def report(latencies, errors, elapsed):
+    total = sum(len(x) for x in latencies.values())
+    print(f"{total} requests in {elapsed:.1f} s: {total / elapsed:,.0f} req/s")
+    print(f"{'request':<20}{'count':>9}{'errors':>9}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, values in sorted(latencies.items()):
+        values = sorted(values)
+        print(f"{name:<20}{len(values):>9}{len(errors[name]):>9}"
+              f"{len(values) / elapsed:>10,.0f}"
+              f"{percentile(values, 50) * 1000:>10.2f}"
+              f"{percentile(values, 99) * 1000:>10.2f}")
+    for name, messages in sorted(errors.items()):
+        if messages:
+            print(f"{name}: {len(messages)} errors, first: {messages[0]}")
+
+
+def run(url, mix=default_mix, threads=8, duration=10.0, seed=0):
+    names = list(mix)
+    weights = [mix[x] for x in names]
+    latencies = {x: [] for x in names}
+    errors = {x: [] for x in names}
+    lock = threading.Lock()
+    # Load the life expectancy page once, so its callback exists
+    get(url + '/life-expectancy')
+    stop = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(f"{seed}-{worker_id}")
+        local = {x: [] for x in names}
+        while time.perf_counter() < stop:
+            name = rng.choices(names, weights=weights)[0]
+            start = time.perf_counter()
+            try:
+                requests[name](url, rng)
+            except Exception as e:
+                errors[name].append(str(e))
+                continue
+            local[name].append(time.perf_counter() - start)
+        with lock:
+            for name in names:
+                latencies[name].extend(local[name])
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for x in workers:
+        x.start()
+    for x in workers:
+        x.join()
+    elapsed = time.perf_counter() - start
+
+    report(latencies, errors, elapsed)
+    return latencies, errors
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, weight = item.split('=')
+        if name not in requests:
+            raise argparse.ArgumentTypeError(
+                f"unknown request '{name}', choose from {', '.join(requests)}")
+        mix[name] = float(weight)
+    return mix
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8888')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mix', type=parse_mix, default=default_mix,
+                        help='e.g. page_navigation=0.5,slider_callback=0.5')
+    args = parser.parse_args()
+
+    latencies, errors = run(args.url.rstrip('/'), args.mix, threads=args.threads,
+                            duration=args.duration, seed=args.seed)
+    if any(errors.values()):
+        sys.exit(1)
@@ -0,0 +1,185 @@
+# Instrumentation of the Dash callbacks
+#
+# Decorate a callback with @instrument() (below @app.callback) to record for
+# every callback:
+# - the number of calls and of errors
+# - the wall time: mean, p50, p95, p99 (of the latest calls) and a histogram
+# - the size of the JSON response (payload) sent to the browser, read from
+#   the response in an after_request hook (the result is not serialized
+#   again to measure it)
+# The metrics are served as JSON at /api/metrics and shown on the (hidden)
+# /metrics page of index.py. With several worker processes (serve.py) every
+# worker has its own metrics.
+#
+# Profiling: with the environment variable DASH_PROFILE_DIR set, every call
+# runs under cProfile and the stats of every callback are written to
+# DASH_PROFILE_DIR/<callback>.prof (accumulated over the calls), e.g.
+# python -m pstats profiles/life_expectancy.update_figure.prof
+#
+# Source:
+# https://docs.python.org/3/library/profile.html
+
+import os
+import time
+import pstats
+import cProfile
+import threading
+import functools
+from bisect import bisect_left
+from collections import deque
+
+from flask import g, has_request_context, jsonify
+from dash.exceptions import PreventUpdate
+
+# Upper bounds of the wall time buckets of the histograms, in ms
+histogram_buckets = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf')]
+
+profile_dir = os.environ.get('DASH_PROFILE_DIR')
+
+
+class CallbackMetrics:
+
+    def __init__(self, max_samples=10000):
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.histogram = [0] * len(histogram_buckets)
+        self.samples = deque(maxlen=max_samples)
+        self.payloads = 0
+        self.payload_bytes = 0
+        self.max_payload_bytes = 0
+        self.last_payload_bytes = 0
+
+    def record(self, seconds, error=False):
+        self.calls += 1
+        self.errors += error
+        self.total_seconds += seconds
+        self.histogram[bisect_left(histogram_buckets, seconds * 1000)] += 1
+        self.samples.append(seconds)
+
+    def record_payload(self, payload_bytes):
+        self.payloads += 1
+        self.payload_bytes += payload_bytes
+        self.max_payload_bytes = max(self.max_payload_bytes, payload_bytes)
+        self.last_payload_bytes = payload_bytes
+
+    def summary(self):
+        samples = sorted(self.samples)
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'mean_ms': 1000 * self.total_seconds / self.calls,
+            'p50_ms': 1000 * percentile(samples, 50),
+            'p95_ms': 1000 * percentile(samples, 95),
+            'p99_ms': 1000 * percentile(samples, 99),
+            'histogram_ms': {str(bound): count for bound, count
+                             in zip(histogram_buckets, self.histogram)},
+            'mean_payload_bytes': self.payload_bytes / self.payloads if self.payloads else 0,
+            'max_payload_bytes': self.max_payload_bytes,
+            'last_payload_bytes': self.last_payload_bytes,
+        }
+
+
+class MetricsRegistry:
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def _metrics(self, name):
+        if name not in self._callbacks:
+            self._callbacks[name] = CallbackMetrics(self.max_samples)
+        return self._callbacks[name]
+
+    def record(self, name, seconds, error=False):
+        with self._lock:
+            self._metrics(name).record(seconds, error)
+
+    def record_payload(self, name, payload_bytes):
+        with self._lock:
+            self._metrics(name).record_payload(payload_bytes)
+
+    def summary(self):
+        with self._lock:
+            return {name: x.summary() for name, x in sorted(self._callbacks.items())}
+
+    def reset(self):
+        with self._lock:
+            self._callbacks.clear()
+
+
+# Nearest-rank percentile of a sorted list
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float('nan')
+    rank = max(int(round(p / 100 * len(sorted_values))), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+metrics = MetricsRegistry()
+
+#############
+# Profiling #
+#############
+
+_profile_stats = {}
+_profile_lock = threading.Lock()
+
+
+# Run a call under cProfile and add its stats to the file of the callback
+def profiled_call(name, function, args, kwargs):
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args, **kwargs)
+    finally:
+        with _profile_lock:
+            if name in _profile_stats:
+                _profile_stats[name].add(profile)
+            else:
+                _profile_stats[name] = pstats.Stats(profile)
+            os.makedirs(profile_dir, exist_ok=True)
+            _profile_stats[name].dump_stats(os.path.join(profile_dir, name + '.prof'))
+
+#############
+# Decorator #
+#############
+
+def instrument(name=None):
+    def decorator(function):
+        label = name or function.__module__ + '.' + function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                if profile_dir:
+                    result = profiled_call(label, function, args, kwargs)
+                else:
+                    result = function(*args, **kwargs)
+            except PreventUpdate:
+                metrics.record(label, time.perf_counter() - start)
+                raise
+            except Exception:
+                metrics.record(label, time.perf_counter() - start, error=True)
+                raise
+            metrics.record(label, time.perf_counter() - start)
+            # The size of the response is recorded by record_response_size
+            if has_request_context():
+                g.metrics_callback = label
+            return result
+        return wrapper
+    return decorator
+
+
+# Size of the response of an instrumented callback, as Dash sent it
+def record_response_size(response):
+    label = g.pop('metrics_callback', None)
+    if label is not None and not response.direct_passthrough:
+        metrics.record_payload(label, response.content_length or len(response.get_data()))
+    return response
+
+
+def register_metrics_route(server, path='/api/metrics'):
+    server.add_url_rule(path, 'metrics', lambda: jsonify(metrics.summary()))
+    server.after_request(record_response_size)
@@ -0,0 +1,74 @@
+# Production server for the dashboard
+#
+# index.py runs the Dash development server: one process, requests handled
+# one by one. This runs app.server with gunicorn, with several worker
+# processes (and threads per worker).
+#
+# The app is loaded once in the master process before the workers are forked
+# (preload), with all apps and their datasets. The workers share these pages
+# of memory with the master until they write to them, so the datasets are
+# not copied per worker. gc.freeze() moves the loaded objects out of the
+# garbage collector, so its passes don't write to (and copy) these pages.
+# Results of expensive callbacks are shared between the workers through
+# shared_cache.py. The callback metrics (/api/metrics) are per worker.
+# The dataset refresh (index.refresh_interval) runs in every worker, it is
+# started after the fork.
+#
+# Usage (Linux / macOS, gunicorn does not run on Windows):
+# python serve.py --workers 4 --threads 4 --bind 0.0.0.0:8888
+#
+# Source:
+# https://docs.gunicorn.org/en/stable/custom.html
+
+import gc
+import argparse
+import multiprocessing
+
+from gunicorn.app.base import BaseApplication
+
+
+def load_server():
+    import index
+    index.load_apps()
+    gc.collect()
+    gc.freeze()
+    return index.server
+
+
+class DashApplication(BaseApplication):
+
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        return load_server()
+
+
+def post_fork(server, worker):
+    import index
+    index.start_refresh()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bind', default='127.0.0.1:8888')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() + 1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--timeout', type=int, default=60)
+    args = parser.parse_args()
+
+    DashApplication({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'preload_app': True,
+        'post_fork': post_fork,
+    }).run()
@@ -0,0 +1,108 @@
+# Cache of callback results shared by all worker processes
+#
+# functools.lru_cache is per process, so with several workers (see serve.py)
+# every worker computes the same results again. memoize() keeps the results
+# in a SQLite file that all workers on the machine use, as a local stand-in
+# for a shared cache server (e.g. Redis). Results are pickled and expire
+# after ttl seconds. With version= (a function, e.g. the version of the
+# dataset the results are computed from) the version is part of the key, so
+# results of an older version are not used, in any worker.
+#
+# Usage:
+# @memoize(ttl=3600, version=lambda: datasets.version('gapminder'))
+# def expensive(year):
+#     ...
+# expensive.cache_clear()
+
+import os
+import time
+import json
+import pickle
+import sqlite3
+import threading
+import functools
+
+cache_path = os.environ.get(
+    'DASH_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'callback_cache.sqlite'))
+
+
+class SharedCache:
+
+    def __init__(self, path=cache_path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        # One connection per thread, opened after the worker processes are
+        # forked (a connection must not be used across a fork)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+              key TEXT PRIMARY KEY,
+              value BLOB NOT NULL,
+              expires REAL NOT NULL
+            )""")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._connect()
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    # (True, value) if the key is cached and not expired, else (False, None)
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return False, None
+        return True, pickle.loads(row[0])
+
+    def set(self, key, value, ttl):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl))
+
+    def delete_prefix(self, prefix):
+        self._connection().execute(
+            "DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def delete_expired(self):
+        self._connection().execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+
+
+_cache = None
+
+
+def shared_cache():
+    global _cache
+    if _cache is None:
+        _cache = SharedCache()
+    return _cache
+
+
+# The arguments must be JSON serializable (as the inputs of a Dash callback)
+def memoize(ttl=3600, version=None):
+    def decorator(function):
+        prefix = function.__module__ + '.' + function.__qualname__ + ':'
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            key = prefix + json.dumps([version() if version else None, args, kwargs],
+                                      sort_keys=True, default=str)
+            found, value = shared_cache().get(key)
+            if not found:
+                value = function(*args, **kwargs)
+                shared_cache().set(key, value, ttl)
+            return value
+
+        wrapper.cache_clear = lambda: shared_cache().delete_prefix(prefix)
+        return wrapper
+    return decorator
@@ -0,0 +1,159 @@
+# Fitted preprocessing of the churn data, for scoring new customers
+#
+# churn_scikit.py creates the dummy variables with pd.get_dummies and fits a
+# StandardScaler on every run, and writes the scaled columns back into the
+# DataFrames. ChurnPreprocessor is fitted once and saved:
+# - the mean and scale of every numeric column (float64, as StandardScaler)
+# - the categories of every categorical column
+# and turns customer records (a DataFrame or a list of dicts, e.g. read from
+# churn.csv) into the same columns as get_dummies + scaling in
+# churn_scikit.py, as one float32 matrix. The numeric columns are scaled in
+# float64 and then cast, so tree models (which also cast to float32) split
+# them as the StandardScaler output. The one-hot part can also be a sparse
+# matrix. Categories are looked up in a dict per column, there is no
+# get_dummies (or DataFrame) in the way; unknown categories get all zeros.
+#
+# The parameters are saved as .npy files (and a JSON file), load() memory-maps
+# them. transform_to_file() writes the matrix of a large file batch by batch
+# to a .npy file, that load_matrix() memory-maps.
+#
+# Usage:
+# preprocessor = ChurnPreprocessor(predictors_num, predictors_cat).fit(train_df)
+# preprocessor.save('models/preprocessor')
+# preprocessor = ChurnPreprocessor.load('models/preprocessor')
+# X = preprocessor.transform(records)
+# X = preprocessor.transform(records, sparse=True)
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+from scipy import sparse as sp
+
+
+class ChurnPreprocessor:
+
+    def __init__(self, numeric_columns, categorical_columns, drop_first=False):
+        self.numeric_columns = list(numeric_columns)
+        self.categorical_columns = list(categorical_columns)
+        self.drop_first = drop_first
+        self.mean = None
+        self.scale = None
+        self.categories = {}
+
+    def fit(self, df):
+        numeric = df[self.numeric_columns].to_numpy(np.float64)
+        self.mean = numeric.mean(axis=0)
+        # As StandardScaler: population standard deviation, 1 for constant columns
+        scale = numeric.std(axis=0)
+        self.scale = np.where(scale == 0, 1, scale)
+        # Sorted as pd.get_dummies
+        self.categories = {x: sorted(df[x].dropna().unique().tolist())
+                           for x in self.categorical_columns}
+        if self.drop_first:
+            self.categories = {x: y[1:] for x, y in self.categories.items()}
+        self._index_categories()
+        return self
+
+    def _index_categories(self):
+        self._lookup = {x: {category: i for i, category in enumerate(y)}
+                        for x, y in self.categories.items()}
+
+    @property
+    def feature_names(self):
+        return self.numeric_columns + [f'{x}_{category}' for x in self.categorical_columns
+                                       for category in self.categories[x]]
+
+    @property
+    def n_one_hot(self):
+        return sum(len(x) for x in self.categories.values())
+
+    # Values of a column of a DataFrame or of a list of dicts
+    @staticmethod
+    def _column(records, name):
+        if isinstance(records, pd.DataFrame):
+            return records[name].tolist()
+        return [x.get(name) for x in records]
+
+    def _numeric(self, records):
+        numeric = np.empty((len(records), len(self.numeric_columns)), dtype=np.float64)
+        for j, name in enumerate(self.numeric_columns):
+            numeric[:, j] = self._column(records, name)
+        numeric -= self.mean
+        numeric /= self.scale
+        return numeric.astype(np.float32)
+
+    # Row and column (in the one-hot part) of every known category
+    def _one_hot_indices(self, records):
+        rows = []
+        columns = []
+        offset = 0
+        for name in self.categorical_columns:
+            lookup = self._lookup[name]
+            for i, value in enumerate(self._column(records, name)):
+                j = lookup.get(value)
+                if j is not None:
+                    rows.append(i)
+                    columns.append(offset + j)
+            offset += len(lookup)
+        return np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)
+
+    # Matrix of the records: the scaled numeric columns, then the dummies
+    def transform(self, records, sparse=False):
+        n = len(records)
+        numeric = self._numeric(records)
+        rows, columns = self._one_hot_indices(records)
+        if sparse:
+            one_hot = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                                    shape=(n, self.n_one_hot))
+            return sp.hstack([sp.csr_matrix(numeric), one_hot], format='csr')
+        X = np.zeros((n, len(self.numeric_columns) + self.n_one_hot), dtype=np.float32)
+        X[:, :len(self.numeric_columns)] = numeric
+        X[rows, len(self.numeric_columns) + columns] = 1
+        return X
+
+    # Transform batches of records (e.g. chunks of read_csv)
+    def transform_batches(self, batches, sparse=False):
+        for batch in batches:
+            yield self.transform(batch, sparse)
+
+    # Transform a churn.csv-shaped file in chunks into a .npy file
+    def transform_to_file(self, csv_path, npy_path, chunksize=100000):
+        n = sum(len(x) for x in pd.read_csv(csv_path, usecols=[self.numeric_columns[0]],
+                                              chunksize=chunksize))
+        X = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.float32,
+                                      shape=(n, len(self.feature_names)))
+        start = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            X[start:start + len(chunk)] = self.transform(chunk)
+            start += len(chunk)
+        X.flush()
+        return npy_path
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'mean.npy'), self.mean)
+        np.save(os.path.join(directory, 'scale.npy'), self.scale)
+        with open(os.path.join(directory, 'preprocessor.json'), 'w') as f:
+            json.dump({'numeric_columns': self.numeric_columns,
+                       'categorical_columns': self.categorical_columns,
+                       'drop_first': self.drop_first,
+                       'categories': self.categories}, f, indent=1)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'preprocessor.json')) as f:
+            config = json.load(f)
+        preprocessor = cls(config['numeric_columns'], config['categorical_columns'],
+                           config['drop_first'])
+        preprocessor.mean = np.load(os.path.join(directory, 'mean.npy'), mmap_mode=mmap_mode)
+        preprocessor.scale = np.load(os.path.join(directory, 'scale.npy'), mmap_mode=mmap_mode)
+        preprocessor.categories = config['categories']
+        preprocessor._index_categories()
+        return preprocessor
+
+
+# Matrix written by transform_to_file, memory-mapped
+def load_matrix(npy_path):
+    return np.load(npy_path, mmap_mode='r')
@@ -5,15 +5,20 @@ from sklearn.svm import LinearSVC
 from sklearn.svm import SVC
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.neural_network import MLPClassifier
-from sklearn.model_selection import GridSearchCV
 from sklearn.metrics import confusion_matrix
 from sklearn.metrics import accuracy_score
 from sklearn.metrics import roc_curve
 
+import multiprocessing
+
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from churn_search import SearchRunner
+from churn_preprocess import ChurnPreprocessor
+from churn_scoring import ModelRegistry
+
 # data: 
 # https://cran.r-project.org/web/packages/modeldata/modeldata.pdf
 
@@ -73,6 +78,17 @@ scaler = preprocessing.StandardScaler().fit(X_train[predictors_num])
 X_train[predictors_num] = scaler.transform(X_train[predictors_num])
 X_test[predictors_num] = scaler.transform(X_test[predictors_num])
 
+# Not scaled yet, for the search runner below: it fits the scaling per fold
+X_train_unscaled = X.loc[X_train.index]
+X_test_unscaled = X.loc[X_test.index]
+
+# The same preprocessing (dummies and scaling) fitted once and saved, to score
+# new customers without get_dummies (see churn_preprocess.py and
+# churn_scoring.py). It gives the columns of X_train and X_test, as float32.
+preprocessor = ChurnPreprocessor(predictors_num, predictors_cat,
+                                 drop_first=not one_hot_encoding).fit(churn_df.loc[X_train.index])
+preprocessor.save('models/preprocessor')
+
 ########################
 # Predictive modelling #
 ########################
@@ -122,18 +138,31 @@ param_grid_svc = [
  ]
 
 # https://scikit-learn.org/stable/modules/model_evaluation.html#scoring-parameter
-search_svc = GridSearchCV(SVC(), param_grid_svc, cv=5, scoring='accuracy')
-search_svc_res = search_svc.fit(X_train, y_train)
-
-# summarize the results of the grid search
-print(search_svc_res.best_score_)
-print(search_svc_res.best_params_)
-
-clf_rbf_svc = SVC(random_state=0, tol=1e-3, max_iter=1e4, 
-                  C=10, kernel='rbf', gamma=0.1).fit(X_train, y_train)
+# GridSearchCV(SVC(), param_grid_svc, cv=5, scoring='accuracy') fits all
+# configurations on all folds, one at a time. The search runner evaluates them
+# in parallel, drops bad configurations early (successive halving) and keeps
+# its results in search_results/, so running it again costs nothing.
+# This script has no if __name__ == '__main__' guard, so the evaluations only
+# run in a process pool where the workers are forked (Linux). With spawn
+# (Windows, macOS) the workers would run this script again.
+# The runner gets the unscaled data: it scales every fold with the mean and
+# standard deviation of the training part of that fold only.
+search_processes = None if multiprocessing.get_start_method() == 'fork' else 1
+search_runner = SearchRunner('search_results', cv=5, scoring='accuracy',
+                             processes=search_processes)
+search_svc_res = search_runner.run('svc', SVC(random_state=0, tol=1e-3, max_iter=1e4),
+                                   param_grid_svc, X_train_unscaled, y_train, predictors_num)
+
+# summarize the results of the search
+print(search_svc_res.best_score)
+print(search_svc_res.best_params)
+search_svc_res.results
+
+# The best configuration, fitted on all training data (scaling and model)
+clf_rbf_svc = search_svc_res.best_estimator
 
 # Performance
-y_test_rbf_svc = clf_rbf_svc.predict(X_test)
+y_test_rbf_svc = clf_rbf_svc.predict(X_test_unscaled)
 eval_performance(y_test, y_test_rbf_svc)
 pd.crosstab(y_test, y_test_rbf_svc, rownames=['True'], colnames=['Predicted'], margins=True)
 
@@ -181,19 +210,40 @@ param_grid_nn = {'hidden_layer_sizes': [(100,), (75,), (50,), (25,), (25,25)],
                  #'activation': ["logistic", "relu"],
                  'alpha': [0.1, 0.01, 0.001, 0.0001]}
 
-search_nn = GridSearchCV(MLPClassifier(max_iter = 10000), param_grid_nn, cv=2, scoring='accuracy')
-search_nn_res = search_nn.fit(X_train, y_train)
+search_runner_nn = SearchRunner('search_results', cv=2, scoring='accuracy',
+                                processes=search_processes)
+search_nn_res = search_runner_nn.run('nn', MLPClassifier(max_iter=10000), param_grid_nn,
+                                     X_train_unscaled, y_train, predictors_num)
 
-# summarize the results of the grid search
-print(search_nn_res.best_score_)
-print(search_nn_res.best_params_)
+# summarize the results of the search
+print(search_nn_res.best_score)
+print(search_nn_res.best_params)
 
-clf_nn = MLPClassifier(hidden_layer_sizes=(25), alpha=0.1, max_iter=10000).fit(X_train, y_train)
+clf_nn = search_nn_res.best_estimator
 
 # Performance
-y_test_nn = clf_nn.predict(X_test)
+y_test_nn = clf_nn.predict(X_test_unscaled)
 eval_performance(y_test, y_test_nn)
 pd.crosstab(y_test, y_test_nn, rownames=['True'], colnames=['Predicted'], margins=True)
 
+##################
+# Model registry #
+##################
+
+# Store the models with the preprocessing, for batch and online scoring, e.g.
+# python churn_scoring.py batch --model rf --input data/churn.csv
+# The preprocessor does the scaling, so for the searched models only the
+# model step of the pipeline is stored (its scaler was fitted on the same
+# training data as the preprocessor).
+registry = ModelRegistry('models/registry')
+for name, clf, y_pred in [('lr', clf_lr, y_test_lr), ('lin_svc', clf_lin_svc, y_test_lin_svc),
+                          ('rbf_svc', clf_rbf_svc.named_steps['model'], y_test_rbf_svc),
+                          ('rf', clf_rf, y_test_rf),
+                          ('nn', clf_nn.named_steps['model'], y_test_nn)]:
+    performance = eval_performance(y_test, y_pred)
+    registry.register(name, clf, preprocessor,
+                      metrics={'acc': performance['acc'], 'sens': performance['sens']})
+registry.models()
+
 
 
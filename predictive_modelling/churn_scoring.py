@@ -0,0 +1,315 @@
+# Model registry and scoring engine for the churn models
+#
+# ModelRegistry stores trained models together with the preprocessing they
+# need (see churn_preprocess.py) and metadata, one directory per version:
+#   models/registry/<name>/<version>/model.joblib
+#                                    preprocessor/
+#                                    metadata.json
+#
+# Scoring turns customer records (churn.csv-shaped: the predictors, churn
+# is not needed) into a churn score: the probability of churn for models
+# with predict_proba, else the decision function.
+# - Batch mode: score_file() splits a CSV file in line-aligned byte ranges,
+#   and a process pool reads and scores them (every worker loads the model
+#   once). The scores are written in the order of the file.
+# - Online mode: MicroBatcher collects concurrent requests (single records)
+#   for up to max_wait seconds or max_batch_size records, and scores them
+#   together, which is much faster than one predict per request.
+# Both report rows/sec and latency percentiles (per chunk resp. request).
+#
+# Usage:
+# registry = ModelRegistry('models/registry')
+# registry.register('rf', clf_rf, preprocessor, metrics={'acc': 0.95})
+# model = registry.load('rf')
+# model.score(records)
+# score_file(registry, 'rf', 'data/churn.csv', 'scores.csv')
+#
+# python churn_scoring.py batch --model rf --input data/churn.csv --output scores.csv
+# python churn_scoring.py online --model rf --requests 10000 --concurrency 200
+
+import io
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import joblib
+import sklearn
+
+from churn_preprocess import ChurnPreprocessor
+
+############
+# Registry #
+############
+
+class ScoringModel:
+
+    def __init__(self, model, preprocessor, metadata):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.metadata = metadata
+        # Models fitted on DataFrames check the column names
+        self._frame_input = hasattr(model, 'feature_names_in_') or hasattr(model, 'steps')
+
+    def score(self, records):
+        X = self.preprocessor.transform(records)
+        if self._frame_input:
+            X = pd.DataFrame(X, columns=self.preprocessor.feature_names)
+        if hasattr(self.model, 'predict_proba'):
+            return self.model.predict_proba(X)[:, 1]
+        return self.model.decision_function(X)
+
+
+class ModelRegistry:
+
+    def __init__(self, directory='models/registry'):
+        self.directory = directory
+
+    def versions(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(x) for x in os.listdir(path) if x.isdigit())
+
+    def models(self):
+        if not os.path.isdir(self.directory):
+            return {}
+        return {x: self.versions(x) for x in sorted(os.listdir(self.directory))}
+
+    # Store a new version of a model, returns the version number
+    def register(self, name, model, preprocessor, metrics=None, description=''):
+        version = (self.versions(name) or [0])[-1] + 1
+        path = os.path.join(self.directory, name, str(version))
+        tmp_path = path + '.tmp'
+        os.makedirs(tmp_path)
+        joblib.dump(model, os.path.join(tmp_path, 'model.joblib'))
+        preprocessor.save(os.path.join(tmp_path, 'preprocessor'))
+        metadata = {
+            'name': name,
+            'version': version,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'model_class': type(model).__name__,
+            'sklearn_version': sklearn.__version__,
+            'feature_names': preprocessor.feature_names,
+            'metrics': {x: float(y) for x, y in (metrics or {}).items()},
+            'description': description,
+        }
+        with open(os.path.join(tmp_path, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f, indent=1)
+        os.replace(tmp_path, path)
+        return version
+
+    # A version of a model (the latest by default)
+    def load(self, name, version=None):
+        version = version or self.versions(name)[-1]
+        path = os.path.join(self.directory, name, str(version))
+        with open(os.path.join(path, 'metadata.json')) as f:
+            metadata = json.load(f)
+        return ScoringModel(joblib.load(os.path.join(path, 'model.joblib')),
+                            ChurnPreprocessor.load(os.path.join(path, 'preprocessor')),
+                            metadata)
+
+##########
+# Report #
+##########
+
+# Nearest-rank percentile of a sorted list
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float('nan')
+    rank = max(int(round(p / 100 * len(sorted_values))), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def report(rows, elapsed, latencies, unit):
+    latencies = sorted(latencies)
+    print(f"{rows:,} rows in {elapsed:.2f} s: {rows / elapsed:,.0f} rows/s")
+    print(f"latency per {unit}: p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.2f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.2f} ms")
+    return {'rows': rows, 'seconds': elapsed, 'rows_per_second': rows / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000}
+
+##############
+# Batch mode #
+##############
+
+# Byte offsets of line-aligned chunks of about chunk_size bytes, after the
+# header line
+def chunk_offsets(path, chunk_size):
+    size = os.path.getsize(path)
+    offsets = []
+    with open(path, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            offsets.append((start, end))
+            start = end
+    return offsets
+
+
+_worker_model = None
+
+
+def _init_worker(directory, name, version):
+    global _worker_model
+    _worker_model = ModelRegistry(directory).load(name, version)
+
+
+def _score_chunk(path, columns, start, end):
+    began = time.perf_counter()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    chunk = pd.read_csv(io.BytesIO(data), header=None, names=columns)
+    return _worker_model.score(chunk), time.perf_counter() - began
+
+
+# Score a CSV file into output_path (columns row, score). Returns the report.
+def score_file(registry, name, input_path, output_path, version=None,
+               chunk_size=4 << 20, processes=None):
+    columns = pd.read_csv(input_path, nrows=0).columns.tolist()
+    offsets = chunk_offsets(input_path, chunk_size)
+    processes = processes or os.cpu_count()
+    latencies = []
+    rows = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(registry.directory, name, version)) as executor, \
+            open(output_path, 'w') as output:
+        output.write('row,score\n')
+        # At most two chunks per process in flight, the scores are written
+        # in order
+        pending = deque()
+        tasks = iter(offsets)
+        for x in tasks:
+            pending.append(executor.submit(_score_chunk, input_path, columns, *x))
+            if len(pending) >= 2 * processes:
+                break
+        while pending:
+            scores, seconds = pending.popleft().result()
+            x = next(tasks, None)
+            if x is not None:
+                pending.append(executor.submit(_score_chunk, input_path, columns, *x))
+            pd.DataFrame({'row': np.arange(rows, rows + len(scores)), 'score': scores}).to_csv(
+                output, header=False, index=False)
+            rows += len(scores)
+            latencies.append(seconds)
+    return report(rows, time.perf_counter() - start, latencies, 'chunk')
+
+###############
+# Online mode #
+###############
+
+class MicroBatcher:
+
+    def __init__(self, model, max_batch_size=64, max_wait=0.002):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = None
+        self._task = None
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    # Score of one record (a dict)
+    async def score(self, record):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((record, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            records = [x[0] for x in batch]
+            try:
+                # In a thread, so new requests are queued meanwhile
+                scores = await loop.run_in_executor(None, self.model.score, records)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), score in zip(batch, scores):
+                if not future.done():
+                    future.set_result(float(score))
+
+
+# Simulate concurrent clients sending single records. Returns the report.
+async def run_online(model, records, n_requests=10000, concurrency=100,
+                     max_batch_size=64, max_wait=0.002, seed=0):
+    batcher = await MicroBatcher(model, max_batch_size, max_wait).start()
+    latencies = []
+    rng = random.Random(seed)
+    requests = [rng.choice(records) for _ in range(n_requests)]
+
+    async def client(client_id):
+        for record in requests[client_id::concurrency]:
+            began = time.perf_counter()
+            await batcher.score(record)
+            latencies.append(time.perf_counter() - began)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(x) for x in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await batcher.stop()
+    return report(n_requests, elapsed, latencies, 'request')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', choices=['batch', 'online', 'list'])
+    parser.add_argument('--registry', default='models/registry')
+    parser.add_argument('--model', default='rf')
+    parser.add_argument('--version', type=int, default=None)
+    parser.add_argument('--input', default='data/churn.csv')
+    parser.add_argument('--output', default='scores.csv')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    if args.mode == 'list':
+        print(registry.models())
+    elif args.mode == 'batch':
+        score_file(registry, args.model, args.input, args.output, args.version,
+                   processes=args.processes)
+    else:
+        model = registry.load(args.model, args.version)
+        records = pd.read_csv(args.input, nrows=10000).to_dict('records')
+        asyncio.run(run_online(model, records, args.requests, args.concurrency,
+                               args.batch_size))
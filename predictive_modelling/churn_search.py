@@ -0,0 +1,225 @@
+# Hyperparameter search for the churn models
+#
+# GridSearchCV in churn_scikit.py fits every configuration on every fold, one
+# after the other, and the best configuration is then fitted again by hand.
+# SearchRunner
+# - evaluates (configuration, fold) pairs in a process pool
+# - fits the preprocessing (scaling of the numeric columns) once per fold,
+#   and stores the preprocessed folds as .npy files that the workers
+#   memory-map
+# - uses successive halving: all configurations are evaluated on one fold,
+#   the best 1/eta go on to more folds, and so on until all folds, so bad
+#   configurations are dropped early
+# - appends every result to results.jsonl as soon as it is computed, so an
+#   interrupted or repeated search only computes what is missing
+# - fits the best configuration on all data and stores the fitted pipeline
+#   (preprocessing and model) with joblib, a repeated search loads it
+# The results are kept per dataset (a hash of X, y and the settings,
+# including the scoring) in directory/<hash>/. A configuration is identified
+# by the name, a hash of the parameters of the base estimator and the grid
+# parameters, so a changed base estimator is evaluated again.
+#
+# Usage:
+# runner = SearchRunner('search_results', cv=5)
+# search = runner.run('svc', SVC(), param_grid_svc, X_train, y_train, predictors_num)
+# search.best_params, search.best_score
+# search.best_estimator.predict(X_test)
+#
+# Sources:
+# https://scikit-learn.org/stable/modules/grid_search.html#successive-halving-user-guide
+# https://arxiv.org/abs/1502.07943 (successive halving)
+
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+
+# Scaling of the numeric columns, the other (dummy) columns pass through
+def make_preprocessor(numeric_columns):
+    return ColumnTransformer([('num', StandardScaler(), list(numeric_columns))],
+                             remainder='passthrough')
+
+
+def config_key(name, estimator, params):
+    base = json.dumps(estimator.get_params(), sort_keys=True, default=repr)
+    return (name + ':' + hashlib.sha1(base.encode()).hexdigest()[:12] + ':'
+            + json.dumps(params, sort_keys=True, default=repr))
+
+
+def dataset_key(X, y, numeric_columns, cv, random_state, scoring):
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(np.asarray(y).tobytes())
+    digest.update(json.dumps([list(X.columns), list(numeric_columns), cv, random_state,
+                              scoring], default=repr).encode())
+    return digest.hexdigest()[:16]
+
+
+class SearchResult:
+
+    def __init__(self, name, results, best_params, best_score, best_estimator):
+        self.name = name
+        # One row per evaluated configuration: params, folds, mean_score
+        self.results = results
+        self.best_params = best_params
+        self.best_score = best_score
+        self.best_estimator = best_estimator
+
+###########
+# Workers #
+###########
+
+def fold_path(directory, fold, part):
+    return os.path.join(directory, f'fold_{fold}_{part}.npy')
+
+
+def evaluate(directory, fold, estimator, scoring):
+    X_train = np.load(fold_path(directory, fold, 'X_train'), mmap_mode='r')
+    y_train = np.load(fold_path(directory, fold, 'y_train'), mmap_mode='r')
+    X_val = np.load(fold_path(directory, fold, 'X_val'), mmap_mode='r')
+    y_val = np.load(fold_path(directory, fold, 'y_val'), mmap_mode='r')
+    start = time.perf_counter()
+    estimator.fit(X_train, y_train)
+    score = get_scorer(scoring)(estimator, X_val, y_val)
+    return float(score), time.perf_counter() - start
+
+##########
+# Runner #
+##########
+
+class SearchRunner:
+
+    def __init__(self, directory='search_results', cv=5, eta=3, processes=None,
+                 scoring='accuracy', random_state=0):
+        self.directory = directory
+        self.cv = cv
+        self.eta = eta
+        self.processes = processes
+        self.scoring = scoring
+        self.random_state = random_state
+
+    # Preprocess every fold once (unless stored already)
+    def _prepare_folds(self, directory, X, y, numeric_columns):
+        if os.path.exists(os.path.join(directory, 'folds.done')):
+            return
+        os.makedirs(directory, exist_ok=True)
+        folds = StratifiedKFold(self.cv, shuffle=True, random_state=self.random_state)
+        for fold, (train, val) in enumerate(folds.split(X, y)):
+            preprocessor = make_preprocessor(numeric_columns).fit(X.iloc[train])
+            parts = {
+                'X_train': preprocessor.transform(X.iloc[train]).astype(np.float64),
+                'y_train': np.asarray(y)[train],
+                'X_val': preprocessor.transform(X.iloc[val]).astype(np.float64),
+                'y_val': np.asarray(y)[val],
+            }
+            for part, values in parts.items():
+                np.save(fold_path(directory, fold, part), values)
+        open(os.path.join(directory, 'folds.done'), 'w').close()
+
+    def _load_results(self, path):
+        scores = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        x = json.loads(line)
+                        scores[(x['config'], x['fold'])] = x['score']
+        return scores
+
+    # Number of folds per round of successive halving, e.g. 1, 3, 5 for 5
+    # folds and eta 3
+    def _rounds(self):
+        rounds = []
+        folds = 1
+        while folds < self.cv:
+            rounds.append(folds)
+            folds *= self.eta
+        return rounds + [self.cv]
+
+    # Yields (config, fold, (score, seconds)) as the tasks complete
+    def _evaluate(self, executor, directory, estimator, configs, tasks):
+        models = {(key, fold): clone(estimator).set_params(**configs[key]) for key, fold in tasks}
+        if executor is None:
+            for key, fold in tasks:
+                yield key, fold, evaluate(directory, fold, models[(key, fold)], self.scoring)
+            return
+        futures = {executor.submit(evaluate, directory, fold, models[(key, fold)], self.scoring):
+                   (key, fold) for key, fold in tasks}
+        for future in as_completed(futures):
+            yield futures[future] + (future.result(),)
+
+    def run(self, name, estimator, param_grid, X, y, numeric_columns):
+        key = dataset_key(X, y, numeric_columns, self.cv, self.random_state, self.scoring)
+        directory = os.path.join(self.directory, key)
+        self._prepare_folds(directory, X, y, numeric_columns)
+        results_path = os.path.join(directory, 'results.jsonl')
+        scores = self._load_results(results_path)
+
+        configs = {config_key(name, estimator, params): params
+                   for params in ParameterGrid(param_grid)}
+        alive = list(configs)
+        # processes=1 evaluates in this process (no pool), e.g. for scripts
+        # without an if __name__ == '__main__' guard on Windows and macOS
+        executor = ProcessPoolExecutor(self.processes) if self.processes != 1 else None
+        try:
+            with open(results_path, 'a') as results_file:
+                for n_folds in self._rounds():
+                    tasks = [(key, fold) for key in alive for fold in range(n_folds)
+                             if (key, fold) not in scores]
+                    evaluated = self._evaluate(executor, directory, estimator, configs, tasks)
+                    for key, fold, (score, seconds) in evaluated:
+                        scores[(key, fold)] = score
+                        results_file.write(json.dumps({'config': key, 'fold': fold,
+                                                       'score': score, 'seconds': seconds}) + '\n')
+                        results_file.flush()
+
+                    # Keep the best 1/eta of the configurations for the next round
+                    mean_scores = {x: np.mean([scores[(x, fold)] for fold in range(n_folds)])
+                                   for x in alive}
+                    if n_folds < self.cv:
+                        keep = max(1, len(alive) // self.eta)
+                        alive = sorted(alive, key=mean_scores.get, reverse=True)[:keep]
+        finally:
+            if executor:
+                executor.shutdown()
+
+        results = pd.DataFrame([
+            {'params': configs[key],
+             'folds': sum((key, fold) in scores for fold in range(self.cv)),
+             'mean_score': np.mean([scores[(key, fold)] for fold in range(self.cv)
+                                    if (key, fold) in scores])}
+            for key in configs
+        ]).sort_values(['folds', 'mean_score'], ascending=False, ignore_index=True)
+        best = max(alive, key=lambda x: mean_scores[x])
+        best_estimator = self._best_estimator(directory, name, best, configs[best],
+                                              estimator, X, y, numeric_columns)
+        return SearchResult(name, results, configs[best], mean_scores[best], best_estimator)
+
+    # The best configuration fitted on all data, stored with joblib
+    def _best_estimator(self, directory, name, key, params, estimator, X, y, numeric_columns):
+        model_path = os.path.join(directory, f'{name}_best.joblib')
+        key_path = os.path.join(directory, f'{name}_best.json')
+        if os.path.exists(key_path):
+            with open(key_path) as f:
+                if json.load(f)['config'] == key:
+                    return joblib.load(model_path)
+
+        pipeline = Pipeline([('preprocess', make_preprocessor(numeric_columns)),
+                             ('model', clone(estimator).set_params(**params))])
+        pipeline.fit(X, y)
+        joblib.dump(pipeline, model_path)
+        with open(key_path, 'w') as f:
+            json.dump({'config': key}, f)
+        return pipeline
@@ -0,0 +1,114 @@
+# Document-term matrix of the books, with TF-IDF and book similarity
+#
+# The books_freq dicts in nltk.py have a vocabulary per book, so comparing
+# books means looping over dicts. Here all books share one vocabulary and the
+# word counts are a sparse (CSR) matrix with a row per book and a column per
+# word. TF-IDF, the most distinctive words of a book and the cosine
+# similarity between books are matrix operations on it.
+#
+# The counts are taken from the token cache (token_cache.py): per book the
+# tokens are already ids, so counting them is a single np.bincount.
+#
+# Usage:
+# dtm = DocumentTermMatrix.from_books(book_paths('books'))
+# dtm.top_terms(k=10)
+# dtm.similarity()
+#
+# Sources:
+# https://docs.scipy.org/doc/scipy/reference/generated/scipy.sparse.csr_matrix.html
+# https://en.wikipedia.org/wiki/Tf%E2%80%93idf
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from token_cache import TokenCache
+
+
+class DocumentTermMatrix:
+
+    def __init__(self, counts, titles, vocab):
+        self.counts = counts
+        self.titles = list(titles)
+        self.vocab = np.asarray(vocab, dtype=object)
+
+    # Build the matrix from the books in one pass: every book's tokens are
+    # counted and their local word ids are mapped to the shared vocabulary
+    @classmethod
+    def from_books(cls, paths, cache=None):
+        cache = cache or TokenCache()
+        books = cache.load_books(paths)
+        vocab_index = {}
+        indptr = [0]
+        indices = []
+        data = []
+        for tokens in books.values():
+            local_counts = np.bincount(np.frombuffer(tokens.ids, dtype=np.uint32),
+                                       minlength=len(tokens.vocab))
+            global_ids = np.fromiter(
+                (vocab_index.setdefault(x, len(vocab_index)) for x in tokens.vocab),
+                dtype=np.int64, count=len(tokens.vocab))
+            nonzero = local_counts.nonzero()[0]
+            indices.append(global_ids[nonzero])
+            data.append(local_counts[nonzero])
+            indptr.append(indptr[-1] + len(nonzero))
+            tokens.close()
+
+        counts = sparse.csr_matrix(
+            (np.concatenate(data).astype(np.float64), np.concatenate(indices),
+             np.array(indptr)),
+            shape=(len(books), len(vocab_index)),
+        )
+        counts.sort_indices()
+        return cls(counts, books.keys(), list(vocab_index))
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    # Number of books each word occurs in
+    def document_frequency(self):
+        return np.diff(self.counts.tocsc().indptr)
+
+    # TF-IDF weights, with the smoothed idf log((1 + n) / (1 + df)) + 1, and
+    # rows scaled to unit length (as TfidfVectorizer in scikit-learn)
+    def tfidf(self, sublinear_tf=False, normalize=True):
+        n_books = self.counts.shape[0]
+        idf = np.log((1 + n_books) / (1 + self.document_frequency())) + 1
+        tf = self.counts.copy()
+        if sublinear_tf:
+            tf.data = 1 + np.log(tf.data)
+        weights = tf @ sparse.diags(idf)
+        if normalize:
+            weights = normalize_rows(weights)
+        return sparse.csr_matrix(weights)
+
+    # The k words with the highest TF-IDF weight per book, as a DataFrame
+    def top_terms(self, k=10, **tfidf_options):
+        weights = self.tfidf(**tfidf_options)
+        rows = []
+        for i, title in enumerate(self.titles):
+            start, end = weights.indptr[i], weights.indptr[i + 1]
+            row_data = weights.data[start:end]
+            row_indices = weights.indices[start:end]
+            top = np.argsort(-row_data, kind='stable')[:k]
+            rows.append(pd.DataFrame({'book': title, 'rank': np.arange(1, len(top) + 1),
+                                      'term': self.vocab[row_indices[top]],
+                                      'tfidf': row_data[top]}))
+        return pd.concat(rows, ignore_index=True)
+
+    # Cosine similarity between the books, as a DataFrame
+    def similarity(self, use_tfidf=True):
+        weights = self.tfidf() if use_tfidf else normalize_rows(self.counts)
+        similarity = (weights @ weights.T).toarray()
+        return pd.DataFrame(similarity, index=self.titles, columns=self.titles)
+
+    def to_frame(self):
+        return pd.DataFrame.sparse.from_spmatrix(self.counts, index=self.titles,
+                                                 columns=self.vocab)
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
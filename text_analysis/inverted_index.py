@@ -0,0 +1,272 @@
+# Positional inverted index over the books folder
+#
+# For every book the index stores, per word, the positions at which the word
+# occurs in the book. With these postings term, boolean and phrase queries
+# give the number of hits per book without reading the books again.
+#
+# Positions are counted in the lowercased, alphabetic tokens of a book
+# (see token_stream.tokenize), without removing stopwords, so phrases such
+# as "pride and prejudice" can be found.
+#
+# On disk every book is a separate segment, so adding or changing a book only
+# (re)writes the segment of that book:
+# - <title>-<key>.postings: per word the gaps between its positions, as
+#   variable-length integers (1 byte for gaps below 128)
+# - <title>-<key>.terms: per word its offset and length in the postings file
+#   and its number of occurrences
+# - index.json: the segment of every book
+#
+# Usage:
+# index = InvertedIndex('.book_index')
+# index.update(book_paths('books'))
+# index.term('monster')
+# index.phrase('pride and prejudice')
+# index.search('"my dear" AND elizabeth NOT darcy')
+#   (operators apply from left to right, without precedence: a OR b AND c
+#   is (a OR b) AND c; NOT darcy alone gives every book without darcy)
+#
+# Source:
+# https://nlp.stanford.edu/IR-book/html/htmledition/positional-indexes-1.html
+
+import os
+import re
+import json
+import mmap
+from array import array
+
+from token_stream import book_title, tokenize
+from token_cache import TokenCache
+
+###################
+# Variable length #
+###################
+
+# Encode non-negative integers with 7 bits per byte, the high bit of a byte
+# is set when more bytes follow
+def encode_varints(values):
+    out = bytearray()
+    for x in values:
+        while x >= 0x80:
+            out.append((x & 0x7F) | 0x80)
+            x >>= 7
+        out.append(x)
+    return bytes(out)
+
+
+def decode_varints(data):
+    values = []
+    x = 0
+    shift = 0
+    for byte in data:
+        x |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(x)
+            x = 0
+            shift = 0
+    return values
+
+
+def encode_positions(positions):
+    gaps = [positions[0]] + [b - a for a, b in zip(positions, positions[1:])]
+    return encode_varints(gaps)
+
+
+def decode_positions(data):
+    positions = decode_varints(data)
+    for i in range(1, len(positions)):
+        positions[i] += positions[i - 1]
+    return positions
+
+###########
+# Segment #
+###########
+
+class Segment:
+
+    def __init__(self, postings_path, terms_path):
+        self.terms = {}
+        with open(terms_path, encoding='utf-8') as f:
+            for line in f:
+                term, offset, length, count = line.rstrip('\n').split('\t')
+                self.terms[term] = (int(offset), int(length), int(count))
+        self._file = open(postings_path, 'rb')
+        if os.path.getsize(postings_path) > 0:
+            self._postings = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._postings = b''
+
+    # Build the segment files of a book from its tokens
+    @staticmethod
+    def write(tokens, postings_path, terms_path):
+        positions = {}
+        for word_id in set(tokens.ids):
+            positions[word_id] = array('I')
+        for position, word_id in enumerate(tokens.ids):
+            positions[word_id].append(position)
+
+        offset = 0
+        with open(postings_path + '.tmp', 'wb') as postings, \
+                open(terms_path + '.tmp', 'w', encoding='utf-8') as terms:
+            for word_id in sorted(positions, key=lambda x: tokens.vocab[x]):
+                data = encode_positions(positions[word_id])
+                postings.write(data)
+                terms.write(f'{tokens.vocab[word_id]}\t{offset}\t{len(data)}\t'
+                            f'{len(positions[word_id])}\n')
+                offset += len(data)
+        os.replace(postings_path + '.tmp', postings_path)
+        os.replace(terms_path + '.tmp', terms_path)
+
+    def count(self, term):
+        entry = self.terms.get(term)
+        return entry[2] if entry else 0
+
+    def positions(self, term):
+        entry = self.terms.get(term)
+        if entry is None:
+            return []
+        offset, length, _ = entry
+        return decode_positions(self._postings[offset:offset + length])
+
+    # Number of times the words occur right after each other
+    def phrase_count(self, words):
+        if any(x not in self.terms for x in words):
+            return 0
+        # Start with the rarest word, it has the fewest candidate positions
+        order = sorted(range(len(words)), key=lambda i: self.count(words[i]))
+        first = order[0]
+        starts = {x - first for x in self.positions(words[first])}
+        for i in order[1:]:
+            if not starts:
+                break
+            starts &= {x - i for x in self.positions(words[i])}
+        return len(starts)
+
+    def close(self):
+        if isinstance(self._postings, mmap.mmap):
+            self._postings.close()
+        self._file.close()
+
+#########
+# Index #
+#########
+
+class InvertedIndex:
+
+    # exact: tokenize the books with word_tokenize (see token_stream.tokenize).
+    # Changing it re-indexes all books on the next update().
+    def __init__(self, directory='.book_index', processes=None, exact=False):
+        self.directory = directory
+        self.exact = exact
+        os.makedirs(directory, exist_ok=True)
+        # No stopwords are removed, phrases need every word
+        self.token_cache = TokenCache(os.path.join(directory, 'tokens'),
+                                      stopword_set=frozenset(), processes=processes,
+                                      exact=exact)
+        self.manifest_path = os.path.join(directory, 'index.json')
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        self.segments = {title: self._open_segment(x)
+                         for title, x in self.manifest.items()}
+
+    def _segment_paths(self, name):
+        name = os.path.join(self.directory, name)
+        return name + '.postings', name + '.terms'
+
+    def _open_segment(self, entry):
+        return Segment(*self._segment_paths(entry['segment']))
+
+    def _save_manifest(self):
+        with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    def _remove_segment(self, title):
+        self.segments.pop(title).close()
+        for path in self._segment_paths(self.manifest.pop(title)['segment']):
+            os.remove(path)
+
+    # Add new books and books that changed since they were indexed.
+    # With remove_missing, books that are not in paths anymore are removed.
+    def update(self, paths, remove_missing=False):
+        keys = {book_title(x): self.token_cache.key(x) for x in paths}
+        changed = [x for x in paths if book_title(x) not in self.manifest
+                   or self.manifest[book_title(x)]['key'] != keys[book_title(x)]]
+        if changed:
+            tokens = self.token_cache.load_books(changed)
+            for path in changed:
+                title = book_title(path)
+                if title in self.manifest:
+                    self._remove_segment(title)
+                name = title + '-' + keys[title]
+                Segment.write(tokens[title], *self._segment_paths(name))
+                self.manifest[title] = {'key': keys[title], 'segment': name,
+                                        'tokens': len(tokens[title])}
+                self.segments[title] = self._open_segment(self.manifest[title])
+                tokens[title].close()
+        if remove_missing:
+            for title in set(self.manifest) - set(keys):
+                self._remove_segment(title)
+        if changed or remove_missing:
+            self._save_manifest()
+        return [book_title(x) for x in changed]
+
+    def remove(self, title):
+        self._remove_segment(title)
+        self._save_manifest()
+
+    ###########
+    # Queries #
+    ###########
+
+    # Number of occurrences of a word per book (books without hits left out)
+    def term(self, word):
+        word = word.lower()
+        hits = {title: x.count(word) for title, x in self.segments.items()}
+        return {title: n for title, n in hits.items() if n}
+
+    # Number of occurrences of a phrase per book
+    def phrase(self, text):
+        words = tokenize(text, exact=self.exact)
+        if not words:
+            return {}
+        if len(words) == 1:
+            return self.term(words[0])
+        hits = {title: x.phrase_count(words) for title, x in self.segments.items()}
+        return {title: n for title, n in hits.items() if n}
+
+    # Books that match a boolean query, with the number of hits of the
+    # (positive) terms and phrases per book.
+    # Terms and "quoted phrases" are combined with AND, OR and NOT, from left
+    # to right; terms without an operator in between are combined with AND.
+    # A query that starts with NOT starts from all books (with 0 hits).
+    def search(self, query):
+        result = None
+        operator = 'AND'
+        for match in re.finditer(r'"([^"]*)"|(\S+)', query):
+            phrase, word = match.groups()
+            if word in ('AND', 'OR', 'NOT'):
+                operator = word
+                continue
+            hits = self.phrase(phrase) if phrase is not None else self.term(word)
+            if result is None:
+                if operator == 'NOT':
+                    result = {x: 0 for x in self.segments if x not in hits}
+                else:
+                    result = hits
+            elif operator == 'AND':
+                result = {x: result[x] + hits[x] for x in result if x in hits}
+            elif operator == 'OR':
+                result = {x: result.get(x, 0) + hits.get(x, 0)
+                          for x in set(result) | set(hits)}
+            else:
+                result = {x: n for x, n in result.items() if x not in hits}
+            operator = 'AND'
+        return result if result is not None else {}
+
+    def close(self):
+        for x in self.segments.values():
+            x.close()
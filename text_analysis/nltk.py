@@ -10,27 +10,103 @@ for file in os.listdir('books'):
         titles.append(file.replace('.txt', ''))
         
 
-books = dict.fromkeys(titles)
-for title in titles:
-    f = open('books/' + title + '.txt', encoding='utf-8')
-    books[title] = f.read().lower()
-    
-# Tokenize the books, remove punctuation and remove stopwords
 stw_set = set(stopwords.words('english'))
 
-for book in books:
-    books[book] = [word for word in word_tokenize(books[book])]
-    books[book] = [word for word in books[book] if word not in stw_set and word.isalpha()]
+# Worker processes started with spawn (Windows, macOS) import this script
+# again, the books are only read and tokenized when it is run
+if __name__ == '__main__':
+    books = dict.fromkeys(titles)
+    for title in titles:
+        f = open('books/' + title + '.txt', encoding='utf-8')
+        books[title] = f.read().lower()
 
-books[titles[0]][1000:1010]
-len(books[titles[1]])
+    # Tokenize the books, remove punctuation and remove stopwords
+    for book in books:
+        books[book] = [word for word in word_tokenize(books[book])]
+        books[book] = [word for word in books[book] if word not in stw_set and word.isalpha()]
 
-books_freq = dict.fromkeys(titles)
-for book in books_freq:
-    books_freq[book] = nltk.FreqDist(books[book])
-    
-books_freq[titles[2]]
+    books[titles[0]][1000:1010]
+    len(books[titles[1]])
 
-books_freq[titles[0]].plot(20, cumulative=False)
-books_freq[titles[1]].plot(20, cumulative=False)
-books_freq[titles[2]].plot(20, cumulative=False)
+    books_freq = dict.fromkeys(titles)
+    for book in books_freq:
+        books_freq[book] = nltk.FreqDist(books[book])
+
+    books_freq[titles[2]]
+
+    books_freq[titles[0]].plot(20, cumulative=False)
+    books_freq[titles[1]].plot(20, cumulative=False)
+    books_freq[titles[2]].plot(20, cumulative=False)
+
+
+##############################
+# Streaming frequency counts #
+##############################
+
+# Same frequencies, without keeping the books in memory and using all cores
+# (see token_stream.py). exact=True tokenizes with word_tokenize as above, the
+# default regex tokenizer is faster but splits some words differently.
+from token_stream import count_books, book_paths
+
+if __name__ == '__main__':
+    books_counts = count_books(book_paths('books'), stw_set, exact=True)
+    books_freq = {title: nltk.FreqDist(books_counts[title]) for title in titles}
+    books_freq[titles[0]].plot(20, cumulative=False)
+
+
+#################
+# Cached tokens #
+#################
+
+# Tokens of the books from the on-disk cache, only tokenized again when a book
+# or the stopwords change (see token_cache.py). exact=True: word_tokenize, as
+# above, so the sections below use the same tokens as the baseline analysis.
+from token_cache import TokenCache
+
+if __name__ == '__main__':
+    books = TokenCache(stopword_set=stw_set, exact=True).load_books(book_paths('books'))
+    books[titles[0]][1000:1010]
+    books_freq = {title: nltk.FreqDist(books[title].counts()) for title in titles}
+
+
+##########
+# Search #
+##########
+
+# Term, boolean and phrase search over the books (see inverted_index.py)
+from inverted_index import InvertedIndex
+
+if __name__ == '__main__':
+    index = InvertedIndex()
+    index.update(book_paths('books'))
+    index.term('monster')
+    index.phrase('it is a truth universally acknowledged')
+    index.search('"my dear" AND elizabeth NOT darcy')
+
+
+##########
+# TF-IDF #
+##########
+
+# Document-term matrix of all books, with the most distinctive words per book
+# and the similarity between books (see document_term_matrix.py)
+from document_term_matrix import DocumentTermMatrix
+
+if __name__ == '__main__':
+    dtm = DocumentTermMatrix.from_books(book_paths('books'),
+                                        TokenCache(stopword_set=stw_set, exact=True))
+    dtm.top_terms(k=10)
+    dtm.similarity()
+
+
+#######################
+# Tokenizer benchmark #
+#######################
+
+# The helper modules above use a regex tokenizer by default, pass exact=True
+# to count_books, TokenCache or InvertedIndex for the word_tokenize results.
+# Tokens per second and agreement of both (see tokenizer_benchmark.py):
+from tokenizer_benchmark import benchmark_tokenizers
+
+if __name__ == '__main__':
+    benchmark_tokenizers(book_paths('books'), stw_set)
@@ -0,0 +1,193 @@
+# On-disk cache of the filtered token streams of the books
+#
+# Tokenizing the books takes most of the time of nltk.py. This module stores
+# the tokens of every book once, in a compact format:
+# - <title>-<key>.vocab: the distinct words, one per line
+# - <title>-<key>.ids: the tokens as 4-byte ids into the vocabulary
+# The id file is memory-mapped when it is loaded, so loading a book takes
+# about as long as reading its vocabulary.
+#
+# The key is a hash of the content of the book, the stopwords and the
+# tokenizer, so a cached book is tokenized again when any of them changes.
+# The content hashes are kept in file_hashes.json with the size and
+# modification time of every book, and a book is only hashed again when
+# those change, so loading cached books doesn't read the books at all.
+#
+# Usage:
+# cache = TokenCache()
+# books = cache.load_books(book_paths('books'))
+# books['frankenstein'][1000:1010]
+
+import os
+import json
+import mmap
+import hashlib
+from array import array
+from collections import Counter
+
+from token_stream import book_title, english_stopwords, iter_token_chunks, token_executor
+
+# Change when tokenize() in token_stream.py changes, to invalidate the cache
+tokenizer_versions = {True: 'word_tokenize-1', False: 'regex-1'}
+
+
+def file_hash(path, block_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def stopwords_hash(stopword_set):
+    return hashlib.sha256('\n'.join(sorted(stopword_set)).encode('utf-8')).hexdigest()
+
+##########
+# Tokens #
+##########
+
+# Tokens of a book backed by the cache files. Behaves like the token lists in
+# nltk.py: len(), indexing, slicing and iterating give words.
+class CachedTokens:
+
+    def __init__(self, vocab, ids, mapped=None):
+        self.vocab = vocab
+        self.ids = ids
+        self._mapped = mapped
+
+    @classmethod
+    def load(cls, ids_path, vocab_path):
+        with open(vocab_path, encoding='utf-8') as f:
+            vocab = f.read().split('\n')[:-1]
+        if os.path.getsize(ids_path) == 0:
+            return cls(vocab, memoryview(array('I')))
+        with open(ids_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(vocab, memoryview(mapped).cast('I'), mapped)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.vocab[x] for x in self.ids[index]]
+        return self.vocab[self.ids[index]]
+
+    def __iter__(self):
+        vocab = self.vocab
+        for x in self.ids:
+            yield vocab[x]
+
+    # Word counts, counted on the ids, so every word is looked up only once
+    def counts(self):
+        return Counter({self.vocab[x]: n for x, n in Counter(self.ids).items()})
+
+    def close(self):
+        self.ids.release()
+        if self._mapped is not None:
+            self._mapped.close()
+
+#########
+# Cache #
+#########
+
+class TokenCache:
+
+    def __init__(self, directory='.token_cache', stopword_set=None, processes=None,
+                 chunk_size=1 << 20, exact=False):
+        if stopword_set is None:
+            stopword_set = english_stopwords()
+        self.directory = directory
+        self.stopword_set = frozenset(stopword_set)
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.exact = exact
+        self._settings_hash = hashlib.sha256(
+            (tokenizer_versions[exact] + stopwords_hash(self.stopword_set)).encode('utf-8')
+        ).hexdigest()
+        os.makedirs(directory, exist_ok=True)
+        self._hashes_path = os.path.join(directory, 'file_hashes.json')
+        self._hashes = {}
+        if os.path.exists(self._hashes_path):
+            with open(self._hashes_path, encoding='utf-8') as f:
+                self._hashes = json.load(f)
+        self._hashes_changed = False
+
+    # Content hash of a book, from file_hashes.json if its size and
+    # modification time didn't change
+    def _file_hash(self, path):
+        stat = os.stat(path)
+        entry = self._hashes.get(os.path.abspath(path))
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+        digest = file_hash(path)
+        self._hashes[os.path.abspath(path)] = {'size': stat.st_size,
+                                               'mtime_ns': stat.st_mtime_ns,
+                                               'sha256': digest}
+        self._hashes_changed = True
+        return digest
+
+    def _save_hashes(self):
+        if not self._hashes_changed:
+            return
+        with open(self._hashes_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self._hashes, f, indent=1)
+        os.replace(self._hashes_path + '.tmp', self._hashes_path)
+        self._hashes_changed = False
+
+    def key(self, path):
+        return hashlib.sha256(
+            (self._file_hash(path) + self._settings_hash).encode('utf-8')
+        ).hexdigest()[:32]
+
+    def _paths(self, path, key):
+        name = os.path.join(self.directory, book_title(path) + '-' + key)
+        return name + '.ids', name + '.vocab'
+
+    # Tokenize a book and write its cache files. The files are written under
+    # a temporary name first, so a cache entry is never half written.
+    def _build(self, path, key, executor):
+        ids_path, vocab_path = self._paths(path, key)
+        word_ids = {}
+        with open(ids_path + '.tmp', 'wb') as f:
+            for tokens in iter_token_chunks(path, chunk_size=self.chunk_size,
+                                            executor=executor):
+                ids = array('I', [word_ids.setdefault(x, len(word_ids)) for x in tokens])
+                ids.tofile(f)
+        with open(vocab_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.writelines(x + '\n' for x in word_ids)
+        os.replace(vocab_path + '.tmp', vocab_path)
+        os.replace(ids_path + '.tmp', ids_path)
+        self._remove_stale(path, key)
+
+    # Remove the cache files of older versions of a book
+    def _remove_stale(self, path, key):
+        prefix = book_title(path) + '-'
+        for x in os.listdir(self.directory):
+            name, extension = os.path.splitext(x)
+            if (extension in ('.ids', '.vocab') and name.startswith(prefix)
+                    and len(name) == len(prefix) + len(key) and name != prefix + key):
+                os.remove(os.path.join(self.directory, x))
+
+    # Tokens of several books, as a dict title -> CachedTokens.
+    # Only the books that are not in the cache yet are tokenized.
+    def load_books(self, paths):
+        keys = {x: self.key(x) for x in paths}
+        self._save_hashes()
+        missing = [x for x in paths if not os.path.exists(self._paths(x, keys[x])[0])]
+        if missing:
+            with token_executor(self.stopword_set, self.processes,
+                                self.exact) as executor:
+                for path in missing:
+                    self._build(path, keys[path], executor)
+        return {book_title(x): CachedTokens.load(*self._paths(x, keys[x]))
+                for x in paths}
+
+    def load(self, path):
+        return self.load_books([path])[book_title(path)]
+
+    def clear(self):
+        for x in os.listdir(self.directory):
+            if x.endswith(('.ids', '.vocab', '.tmp')):
+                os.remove(os.path.join(self.directory, x))
+
@@ -0,0 +1,190 @@
+# Streaming, multi-process word counts for a folder of books
+#
+# nltk.py reads every book in memory, tokenizes it in one go and keeps the
+# full token lists. Here every book is split into chunks of about
+# chunk_size bytes, which are tokenized in a pool of processes. Each chunk
+# gives a Counter of the words in it, and the counters of all chunks of a
+# book are merged. Memory use therefore depends on the chunk size and the
+# vocabulary, not on the size of the books, and all cores are used.
+#
+# nltk is only imported when it is needed, through nltk_module(): in this
+# folder nltk.py hides the nltk package, and worker processes started with
+# spawn (the default on Windows and macOS) have the folder on sys.path.
+#
+# Usage:
+# books_counts = count_books(book_paths('books'))
+# merge_counts(books_counts.values()).most_common(10)
+#
+# Sources:
+# https://www.nltk.org/api/nltk.tokenize.html
+# https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+
+import os
+import re
+import sys
+import importlib
+from itertools import filterfalse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+folder = os.path.dirname(os.path.abspath(__file__))
+
+
+# A module of the nltk package (e.g. 'nltk.corpus'), imported without this
+# folder on sys.path, so nltk.py is not imported instead of the package
+def nltk_module(name):
+    path = sys.path[:]
+    sys.path[:] = [x for x in path if os.path.abspath(x or os.curdir) != folder]
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path[:] = path
+
+
+def english_stopwords():
+    return frozenset(nltk_module('nltk.corpus').stopwords.words('english'))
+
+##########
+# Chunks #
+##########
+
+# Byte offsets (start, end) of the chunks of a file. Chunks end at the end
+# of a line, so no word is split over two chunks. Line ends are single bytes
+# in UTF-8, so every chunk can also be decoded on its own.
+def chunk_offsets(path, chunk_size=1 << 20):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = f.tell()
+            yield start, end
+            start = end
+
+
+def read_chunk(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start).decode('utf-8')
+
+
+def book_title(path):
+    return os.path.basename(path).replace('.txt', '')
+
+
+def book_paths(folder):
+    return sorted(os.path.join(folder, x) for x in os.listdir(folder)
+                  if x.endswith('.txt'))
+
+################
+# Tokenization #
+################
+
+# Runs of letters (any alphabet, no digits or underscores)
+word_pattern = re.compile(r'[^\W\d_]+')
+
+
+# Lowercase and tokenize a text, and keep the alphabetic tokens that are not
+# a stopword.
+# With exact=True this takes the same steps as nltk.py: word_tokenize and a
+# check per token. By default a single regular expression finds the
+# alphabetic words and the stopwords are removed by filterfalse, so no Python
+# code runs per token. The results differ for words with an apostrophe or a
+# hyphen: "don't" gives "do" with word_tokenize and "don", "t" here, and
+# "well-known" is dropped by word_tokenize and gives "well", "known" here.
+# See tokenizer_benchmark.py for the speed and agreement of both.
+def tokenize(text, stopword_set=frozenset(), exact=False):
+    if exact:
+        word_tokenize = nltk_module('nltk.tokenize').word_tokenize
+        return [word for word in word_tokenize(text.lower())
+                if word not in stopword_set and word.isalpha()]
+    words = word_pattern.findall(text.lower())
+    if not stopword_set:
+        return words
+    return list(filterfalse(stopword_set.__contains__, words))
+
+
+# The settings are sent to every worker process once, instead of with every
+# chunk
+_worker_stopwords = frozenset()
+_worker_exact = False
+
+
+def _init_worker(stopword_set, exact):
+    global _worker_stopwords, _worker_exact
+    _worker_stopwords = stopword_set
+    _worker_exact = exact
+
+
+def _tokenize_chunk(task):
+    path, start, end = task
+    return tokenize(read_chunk(path, start, end), _worker_stopwords, _worker_exact)
+
+
+def _count_chunk(task):
+    return task[0], Counter(_tokenize_chunk(task))
+
+
+def _tasks(paths, chunk_size):
+    for path in paths:
+        for start, end in chunk_offsets(path, chunk_size):
+            yield path, start, end
+
+
+# Pool of processes that tokenize chunks, stopword_set defaults to the
+# English stopwords of nltk
+def token_executor(stopword_set=None, processes=None, exact=False):
+    if stopword_set is None:
+        stopword_set = english_stopwords()
+    return ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                               initargs=(frozenset(stopword_set), exact))
+
+############
+# Counting #
+############
+
+# Word counts per book, as a dict title -> Counter.
+# The counters can be merged with +, or turned into an nltk.FreqDist.
+def count_books(paths, stopword_set=None, processes=None, chunk_size=1 << 20,
+                exact=False):
+    counts = {book_title(x): Counter() for x in paths}
+
+    def merge(future):
+        path, chunk_counts = future.result()
+        counts[book_title(path)].update(chunk_counts)
+
+    # Only a few chunks per process are queued at any time, so the results
+    # waiting to be merged don't pile up
+    max_pending = 4 * (processes or os.cpu_count() or 1)
+    pending = deque()
+    with token_executor(stopword_set, processes, exact) as executor:
+        for task in _tasks(paths, chunk_size):
+            pending.append(executor.submit(_count_chunk, task))
+            if len(pending) >= max_pending:
+                merge(pending.popleft())
+        while pending:
+            merge(pending.popleft())
+    return counts
+
+
+# Tokens of a book in their original order, as one list per chunk.
+# To tokenize several books, pass an executor created with
+# token_executor(), so the processes are started only once.
+def iter_token_chunks(path, stopword_set=None, processes=None,
+                      chunk_size=1 << 20, executor=None, exact=False):
+    if executor is None:
+        with token_executor(stopword_set, processes, exact) as executor:
+            yield from iter_token_chunks(path, chunk_size=chunk_size,
+                                         executor=executor)
+        return
+    yield from executor.map(_tokenize_chunk, _tasks([path], chunk_size))
+
+
+# Word counts over all books together
+def merge_counts(counts):
+    total = Counter()
+    for x in counts:
+        total.update(x)
+    return total
+
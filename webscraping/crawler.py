@@ -0,0 +1,209 @@
+# Concurrent crawler for paginated result pages
+#
+# webscraping.py fetches one page with a blocking requests.get. The crawler
+# fetches many pages concurrently with asyncio and aiohttp:
+# - a bounded connection pool (max_connections, and per_host per host)
+# - a rate limit per host (requests_per_second)
+# - retries with exponential backoff (and jitter) on connection errors,
+#   timeouts, 429 and 5xx responses; Retry-After is respected
+# - an on-disk response cache: a cached page is revalidated with
+#   If-None-Match / If-Modified-Since, and a 304 Not Modified response
+#   costs no download. Pages younger than max_age seconds are not
+#   requested at all.
+#
+# Usage:
+# crawler = Crawler(requests_per_second=2)
+# pages = crawler.crawl(page_urls(url, 10))  # {url: html bytes}
+# crawler.stats
+#
+# Against the local stand-in (see fixture_server.py):
+# python crawler.py --fixtures --pages 3
+#
+# Sources:
+# https://docs.aiohttp.org/en/stable/client_advanced.html#limiting-connection-pool-size
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from urllib.parse import urlparse
+
+import aiohttp
+
+from fixture_server import FixtureServer, page_urls
+
+search_path = '/search/title/?release_date=2018-01-01,2018-12-31'
+url = 'https://www.imdb.com' + search_path
+
+retry_statuses = {429, 500, 502, 503, 504}
+
+
+class ResponseCache:
+
+    def __init__(self, directory='.http_cache'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url, extension):
+        return os.path.join(self.directory,
+                            hashlib.sha256(url.encode()).hexdigest() + extension)
+
+    # (metadata, body) of a cached url, or None
+    def get(self, url):
+        try:
+            with open(self._path(url, '.json')) as f:
+                meta = json.load(f)
+            with open(self._path(url, '.body'), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        return meta, body
+
+    # The body is written before the metadata, so a metadata file always
+    # belongs to a complete body
+    def put(self, url, body, etag=None, last_modified=None):
+        tmp_path = self._path(url, '.body.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, self._path(url, '.body'))
+        self.touch(url, {'url': url, 'etag': etag, 'last_modified': last_modified})
+
+    # Store the metadata with a new validation time
+    def touch(self, url, meta):
+        meta = dict(meta, validated=time.time())
+        tmp_path = self._path(url, '.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path(url, '.json'))
+
+
+class RateLimiter:
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self._next = {}
+        self._lock = asyncio.Lock()
+
+    # Wait for the next free slot of the host
+    async def wait(self, host):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        await asyncio.sleep(start - now)
+
+
+class Crawler:
+
+    def __init__(self, max_connections=10, per_host=4, requests_per_second=2.0,
+                 retries=3, backoff=0.5, timeout=30.0, cache_dir='.http_cache',
+                 max_age=0, headers=None):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.requests_per_second = requests_per_second
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.max_age = max_age
+        self.headers = headers or {'Accept-Language': 'en-US,en;q=0.5'}
+        self.stats = Counter()
+        self.errors = []
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt * (1 + random.random())
+
+    async def fetch(self, session, limiter, url):
+        cached = self.cache.get(url) if self.cache else None
+        headers = {}
+        if cached:
+            meta, body = cached
+            if time.time() - meta['validated'] < self.max_age:
+                self.stats['cache_hits'] += 1
+                return body
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        host = urlparse(url).netloc
+        for attempt in range(self.retries + 1):
+            await limiter.wait(host)
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304 and cached:
+                        self.stats['not_modified'] += 1
+                        self.cache.touch(url, cached[0])
+                        return cached[1]
+                    if response.status in retry_statuses and attempt < self.retries:
+                        delay = self._backoff_delay(attempt, response.headers.get('Retry-After'))
+                    else:
+                        response.raise_for_status()
+                        body = await response.read()
+                        self.stats['downloaded'] += 1
+                        if self.cache:
+                            self.cache.put(url, body, response.headers.get('ETag'),
+                                           response.headers.get('Last-Modified'))
+                        return body
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+
+    # Fetch all urls, returns {url: body}. Failed urls (after the retries)
+    # are left out, their errors are in self.errors.
+    async def crawl_async(self, urls):
+        connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                         limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        limiter = RateLimiter(self.requests_per_second)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=self.headers) as session:
+            bodies = await asyncio.gather(*(self.fetch(session, limiter, x) for x in urls),
+                                          return_exceptions=True)
+        pages = {}
+        for url, body in zip(urls, bodies):
+            if isinstance(body, BaseException):
+                self.stats['failed'] += 1
+                self.errors.append((url, body))
+            else:
+                pages[url] = body
+        return pages
+
+    def crawl(self, urls):
+        return asyncio.run(self.crawl_async(list(urls)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=3)
+    parser.add_argument('--fixtures', action='store_true',
+                        help='crawl the local stand-in instead of IMDb')
+    parser.add_argument('--rate', type=float, default=2.0, help='requests per second per host')
+    parser.add_argument('--connections', type=int, default=10)
+    parser.add_argument('--cache-dir', default='.http_cache')
+    args = parser.parse_args()
+
+    crawler = Crawler(max_connections=args.connections, requests_per_second=args.rate,
+                      cache_dir=args.cache_dir)
+    if args.fixtures:
+        # A fixed port, so the page urls (and cache keys) are the same on
+        # every run and a second run revalidates the cached pages
+        with FixtureServer(port=8765) as server:
+            start = time.perf_counter()
+            pages = crawler.crawl(page_urls(server.url + search_path, args.pages))
+    else:
+        start = time.perf_counter()
+        pages = crawler.crawl(page_urls(url, args.pages))
+    print(f'{len(pages)} pages in {time.perf_counter() - start:.2f} s', dict(crawler.stats))
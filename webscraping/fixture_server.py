@@ -0,0 +1,229 @@
+# Local stand-in for the IMDb search pages, to test the crawler offline
+#
+# Serves the saved result pages in fixtures/ (page_1.html, page_2.html, ...)
+# for /search/title/?...&start=1, &start=51, ... like IMDb paginates its
+# results (50 movies per page). Responses have an ETag and a Last-Modified
+# header and conditional requests get 304 Not Modified.
+# For tests of the crawler the server can be slowed down (delay) and made to
+# fail (fail_every: every n-th request gets 503 Service Unavailable).
+#
+# The fixtures have the markup of the IMDb result list that webscraping.py
+# parses (div.lister-item-content etc.), with generated movies. They are
+# written with:
+# python fixture_server.py --write 3
+#
+# Usage:
+# with FixtureServer() as server:
+#     urls = page_urls(server.url + '/search/title/?release_date=2018-01-01,2018-12-31', 3)
+
+import os
+import time
+import random
+import hashlib
+import argparse
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+per_page = 50
+
+############
+# Fixtures #
+############
+
+movie_template = '''<div class="lister-item mode-advanced">
+<div class="lister-item-content">
+<h3 class="lister-item-header">
+<span class="lister-item-index unbold text-primary">{rank}.</span>
+<a href="/title/tt{id:07d}/">{title}</a>
+<span class="lister-item-year text-muted unbold">(2018)</span>
+</h3>
+<p class="text-muted ">
+<span class="certificate">PG-13</span>
+<span class="ghost">|</span>
+<span class="runtime">{runtime} min</span>
+<span class="ghost">|</span>
+<span class="genre">{genre}</span>
+</p>
+<div class="ratings-bar">
+<div class="inline-block ratings-imdb-rating" name="ir" data-value="{rating}">
+<span class="global-sprite rating-star imdb-rating"></span>
+<strong>{rating}</strong>
+</div>
+{metascore}</div>
+<p class="text-muted">{plot}</p>
+<p class="sort-num_votes-visible">
+<span class="text-muted">Votes:</span>
+<span name="nv" data-value="{votes}">{votes:,}</span>
+</p>
+</div>
+</div>
+'''
+
+metascore_template = '''<div class="inline-block ratings-metascore">
+<span class="metascore  favorable">{metascore}        </span>
+Metascore
+</div>
+'''
+
+page_template = '''<!DOCTYPE html>
+<html>
+<head><title>Feature Film, Released between 2018-01-01 and 2018-12-31 - IMDb</title></head>
+<body>
+<div class="lister list detail sub-list">
+<div class="lister-list">
+{movies}</div>
+</div>
+</body>
+</html>
+'''
+
+words = ['Black', 'Panther', 'Avengers', 'Infinity', 'War', 'Quiet', 'Place',
+         'Star', 'Venom', 'Bohemian', 'Rhapsody', 'Aquaman', 'Halloween', 'Roma',
+         'Green', 'Book', 'Incredibles', 'Spider', 'Verse', 'Widows', 'Shoplifters']
+genres = ['Action, Adventure, Sci-Fi', 'Drama', 'Comedy, Drama', 'Horror, Thriller',
+          'Animation, Action, Adventure', 'Biography, Drama, Music']
+
+
+def movie_html(rank, rng):
+    # Some movies have no Metascore, as on IMDb
+    metascore = rng.random() < 0.8
+    return movie_template.format(
+        rank=rank,
+        id=rng.randrange(1, 10**7),
+        title=' '.join(rng.sample(words, rng.randint(1, 4))),
+        runtime=rng.randint(80, 180),
+        genre=rng.choice(genres),
+        rating=round(rng.uniform(4, 9), 1),
+        metascore=metascore_template.format(metascore=rng.randint(30, 95)) if metascore else '',
+        plot='A story about ' + ' '.join(rng.sample(words, 5)).lower() + '.',
+        votes=rng.randint(1000, 800000),
+    )
+
+
+def page_html(page, seed=0):
+    rng = random.Random(f'{seed}-{page}')
+    start = (page - 1) * per_page + 1
+    return page_template.format(
+        movies=''.join(movie_html(rank, rng) for rank in range(start, start + per_page)))
+
+
+def write_fixtures(pages, directory=fixtures_dir, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    for page in range(1, pages + 1):
+        with open(os.path.join(directory, f'page_{page}.html'), 'w', encoding='utf-8') as f:
+            f.write(page_html(page, seed))
+
+
+def fixture_paths(directory=fixtures_dir):
+    names = [x for x in os.listdir(directory) if x.startswith('page_') and x.endswith('.html')]
+    return [os.path.join(directory, x)
+            for x in sorted(names, key=lambda x: int(x[5:-5]))]
+
+
+# The urls of the result pages 1 .. pages of a search url
+def page_urls(search_url, pages):
+    separator = '&' if '?' in search_url else '?'
+    return [f'{search_url}{separator}start={(page - 1) * per_page + 1}'
+            for page in range(1, pages + 1)]
+
+##########
+# Server #
+##########
+
+class FixtureHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            count = server.request_count
+        if server.delay:
+            time.sleep(server.delay)
+        if server.fail_every and count % server.fail_every == 0:
+            self.send_error(503)
+            return
+
+        query = parse_qs(urlparse(self.path).query)
+        page = (int(query.get('start', ['1'])[0]) - 1) // per_page + 1
+        path = os.path.join(server.directory, f'page_{page}.html')
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+
+        with open(path, 'rb') as f:
+            body = f.read()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        last_modified = formatdate(os.path.getmtime(path), usegmt=True)
+        if (self.headers.get('If-None-Match') == etag
+                or (self.headers.get('If-None-Match') is None
+                    and self.headers.get('If-Modified-Since') == last_modified)):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+
+    def __init__(self, directory=fixtures_dir, host='127.0.0.1', port=0,
+                 delay=0.0, fail_every=0):
+        self.httpd = ThreadingHTTPServer((host, port), FixtureHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.directory = directory
+        self.httpd.delay = delay
+        self.httpd.fail_every = fail_every
+        self.httpd.request_count = 0
+        self.httpd.lock = threading.Lock()
+        self.url = f'http://{host}:{self.httpd.server_address[1]}'
+        self._thread = None
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--write', type=int, metavar='PAGES',
+                        help='write this many fixture pages and exit')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--fail-every', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.write:
+        write_fixtures(args.write)
+    else:
+        server = FixtureServer(port=args.port, delay=args.delay, fail_every=args.fail_every)
+        print('Serving fixtures on', server.url)
+        server.httpd.serve_forever()
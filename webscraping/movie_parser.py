@@ -0,0 +1,177 @@
+# Fast extraction of the movies of IMDb result pages
+#
+# webscraping.py parses a page with BeautifulSoup and runs six CSS selects
+# per movie. Here
+# - the pages are parsed with lxml
+# - besides the columns of webscraping.py, the IMDb id of every movie
+#   (title_id, from the link of its title) is extracted, as a stable key
+# - the CSS selectors are compiled once (to XPath) and reused for all movies
+# - the values are collected per column in lists, and turned into a typed
+#   DataFrame once at the end
+# - many pages are parsed in a process pool
+#
+# Usage:
+# movies = parse_pages(list_of_html_bytes)
+#
+# Benchmark on the saved pages in fixtures/ (see fixture_server.py):
+# python movie_parser.py --copies 20
+#
+# Source:
+# https://lxml.de/cssselect.html
+
+import os
+import re
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import lxml.html
+from lxml.cssselect import CSSSelector
+import pandas as pd
+
+from fixture_server import fixture_paths
+
+movie_selector = CSSSelector('div.lister-item-content')
+
+# The same selectors as parse_movie in webscraping.py
+field_selectors = {
+    'rank': CSSSelector('.text-primary'),
+    'title': CSSSelector('.lister-item-header a'),
+    'runtime': CSSSelector('.runtime'),
+    'rating': CSSSelector('.ratings-imdb-rating strong'),
+    'number_of_votes': CSSSelector('p.sort-num_votes-visible > span:nth-child(2)'),
+    'metascore': CSSSelector('.metascore'),
+}
+
+columns = list(field_selectors) + ['title_id']
+
+title_id_pattern = re.compile(r'/title/(tt\d+)')
+
+
+# Text of the first match, stripped as BeautifulSoup's get_text(strip=True),
+# or None without a match
+def first_text(matches):
+    if not matches:
+        return None
+    return ''.join(x.strip() for x in matches[0].itertext())
+
+
+# IMDb id (ttNNNNNNN) in the link of the first match, or None
+def link_title_id(matches):
+    if not matches:
+        return None
+    match = title_id_pattern.search(matches[0].get('href') or '')
+    return match.group(1) if match else None
+
+
+def empty_columns():
+    return {x: [] for x in columns}
+
+
+# Add the movies of a page to the column lists
+def parse_page(html, buffers=None):
+    buffers = buffers if buffers is not None else empty_columns()
+    root = lxml.html.fromstring(html)
+    for node in movie_selector(root):
+        for name, selector in field_selectors.items():
+            matches = selector(node)
+            buffers[name].append(first_text(matches))
+            if name == 'title':
+                buffers['title_id'].append(link_title_id(matches))
+    return buffers
+
+
+def parse_page_list(pages):
+    buffers = empty_columns()
+    for html in pages:
+        parse_page(html, buffers)
+    return buffers
+
+
+# Typed DataFrame of the column lists, with the conversions of webscraping.py
+def to_frame(buffers):
+    movies = pd.DataFrame(buffers, columns=columns, dtype=object)
+    movies['rank'] = movies['rank'].str.replace('.', '', regex=False).astype('int64')
+    movies['title'] = movies['title'].astype('string')
+    movies['runtime'] = movies['runtime'].str.replace('min', '', regex=False).astype('float64')
+    movies['rating'] = movies['rating'].astype('float64')
+    movies['number_of_votes'] = (movies['number_of_votes']
+                                 .str.replace(',', '', regex=False).astype('float64'))
+    movies['metascore'] = movies['metascore'].astype('float64')
+    movies['title_id'] = movies['title_id'].astype('string')
+    return movies
+
+
+# Parse pages (HTML as bytes or str) into one DataFrame. With processes > 1
+# the pages are parsed in a process pool, in batches of pages_per_task.
+def parse_pages(pages, processes=None, pages_per_task=8):
+    pages = list(pages)
+    processes = processes or os.cpu_count()
+    if processes == 1 or len(pages) <= pages_per_task:
+        return to_frame(parse_page_list(pages))
+
+    tasks = [pages[i:i + pages_per_task] for i in range(0, len(pages), pages_per_task)]
+    buffers = empty_columns()
+    with ProcessPoolExecutor(processes) as executor:
+        for part in executor.map(parse_page_list, tasks):
+            for name in columns:
+                buffers[name].extend(part[name])
+    return to_frame(buffers)
+
+#############
+# Benchmark #
+#############
+
+# The parsing of webscraping.py, without the quadratic append
+def parse_pages_bs4(pages):
+    from bs4 import BeautifulSoup
+
+    def extract_text(text):
+        if not text:
+            return None
+        return text[0].get_text(strip=True)
+
+    buffers = empty_columns()
+    for html in pages:
+        soup = BeautifulSoup(html, 'html.parser')
+        for node in soup.find_all('div', class_='lister-item-content'):
+            buffers['rank'].append(extract_text(node.select('.text-primary')))
+            title = node.select('.lister-item-header a')
+            buffers['title'].append(extract_text(title))
+            buffers['title_id'].append(link_title_id(title))
+            buffers['runtime'].append(extract_text(node.select('.runtime')))
+            buffers['rating'].append(extract_text(node.select('.ratings-imdb-rating strong')))
+            buffers['number_of_votes'].append(
+                extract_text(node.select('p.sort-num_votes-visible > span:nth-child(2)')))
+            buffers['metascore'].append(extract_text(node.select('.metascore')))
+    return to_frame(buffers)
+
+
+def benchmark(pages, processes=None):
+    runs = {
+        'bs4 html.parser': lambda: parse_pages_bs4(pages),
+        'lxml': lambda: parse_pages(pages, processes=1),
+        f'lxml, {processes or os.cpu_count()} processes': lambda: parse_pages(pages, processes),
+    }
+    results = []
+    for name, run in runs.items():
+        start = time.perf_counter()
+        movies = run()
+        seconds = time.perf_counter() - start
+        results.append({'parser': name, 'pages': len(pages), 'movies': len(movies),
+                        'seconds': seconds, 'pages_per_second': len(pages) / seconds})
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--copies', type=int, default=20,
+                        help='parse every fixture page this many times')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    pages = []
+    for path in fixture_paths():
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    print(benchmark(pages * args.copies, args.processes).to_string(index=False))
@@ -0,0 +1,206 @@
+# Persistent store of the scraped movies, for cheap periodic re-scrapes
+#
+# webscraping.py fetches and parses the full listing on every run. The store
+# keeps, in a SQLite database,
+# - pages: every fetched result page (url) with the hash of its content.
+#   A page with the same hash as before is not parsed again.
+# - movies: the latest values of every movie, keyed by its IMDb id
+#   (title_id, ttNNNNNNN). Rows of a changed page are upserted, and only rows
+#   whose rank, rating, number_of_votes or metascore changed are updated, so
+#   a movie that moves in the listing keeps one row. Movies without an id
+#   (no or an unexpected title link) are skipped, with a warning.
+# - movie_history: the previous values of every updated movie, written by a
+#   trigger on movies, with the time they were replaced.
+#
+# Usage:
+# store = ScrapeStore('imdb.sqlite')
+# scrape(page_urls(url, 10), store)   # fetch, skip unchanged, upsert
+# store.movies()
+# store.history('Black Panther')
+#
+# python scrape_store.py --fixtures --pages 3
+
+import time
+import logging
+import sqlite3
+import hashlib
+import argparse
+
+import pandas as pd
+
+from crawler import Crawler, url, search_path
+from fixture_server import FixtureServer, page_urls
+from movie_parser import parse_page, to_frame
+
+create_tables = """
+CREATE TABLE IF NOT EXISTS pages (
+  url TEXT PRIMARY KEY,
+  content_hash TEXT NOT NULL,
+  fetched_at REAL NOT NULL,
+  changed_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS movies (
+  title_id TEXT NOT NULL PRIMARY KEY,
+  title TEXT NOT NULL,
+  rank INTEGER NOT NULL,
+  runtime REAL,
+  rating REAL,
+  number_of_votes REAL,
+  metascore REAL,
+  page_url TEXT NOT NULL,
+  updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS movie_history (
+  title_id TEXT NOT NULL,
+  title TEXT NOT NULL,
+  rank INTEGER NOT NULL,
+  rating REAL,
+  number_of_votes REAL,
+  metascore REAL,
+  valid_from REAL NOT NULL,
+  valid_to REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS movie_history_title_id
+ON movie_history (title_id, valid_to);
+
+CREATE TRIGGER IF NOT EXISTS movies_history
+AFTER UPDATE OF rank, rating, number_of_votes, metascore ON movies
+BEGIN
+  INSERT INTO movie_history (title_id, title, rank, rating, number_of_votes, metascore,
+                             valid_from, valid_to)
+  VALUES (old.title_id, old.title, old.rank, old.rating, old.number_of_votes, old.metascore,
+          old.updated_at, new.updated_at);
+END;
+"""
+
+# Only rows with changed values are updated ("IS NOT" also compares NULLs)
+upsert_movie = """
+INSERT INTO movies (title_id, title, rank, runtime, rating, number_of_votes, metascore,
+                    page_url, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (title_id) DO UPDATE SET
+  title = excluded.title,
+  rank = excluded.rank,
+  runtime = excluded.runtime,
+  rating = excluded.rating,
+  number_of_votes = excluded.number_of_votes,
+  metascore = excluded.metascore,
+  page_url = excluded.page_url,
+  updated_at = excluded.updated_at
+WHERE rank IS NOT excluded.rank
+   OR rating IS NOT excluded.rating
+   OR number_of_votes IS NOT excluded.number_of_votes
+   OR metascore IS NOT excluded.metascore
+"""
+
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+# None instead of pandas' missing values (NaN, NA), for SQLite
+def sql_value(x):
+    return None if pd.isna(x) else x
+
+
+class ScrapeStore:
+
+    def __init__(self, path='imdb.sqlite'):
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(create_tables)
+
+    def close(self):
+        self.connection.close()
+
+    def page_hash(self, url):
+        row = self.connection.execute(
+            "SELECT content_hash FROM pages WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    # Store a fetched page. Returns None if its content didn't change,
+    # else the number of movies that were inserted or updated.
+    def store_page(self, url, body, now=None):
+        now = now or time.time()
+        digest = content_hash(body)
+        if self.page_hash(url) == digest:
+            self.connection.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (now, url))
+            return None
+
+        movies = to_frame(parse_page(body))
+        missing_id = movies['title_id'].isna()
+        if missing_id.any():
+            logger.warning('Skipped %d movies without a title id on %s: %s', missing_id.sum(),
+                           url, ', '.join(movies.loc[missing_id, 'title'].fillna('?')))
+            movies = movies[~missing_id]
+        rows = [(x.title_id, x.title, x.rank, sql_value(x.runtime), sql_value(x.rating),
+                 sql_value(x.number_of_votes), sql_value(x.metascore), url, now)
+                for x in movies.itertuples(index=False)]
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # rowcount doesn't count the rows written by the trigger
+            changed = self.connection.executemany(upsert_movie, rows).rowcount
+            self.connection.execute("""
+            INSERT INTO pages (url, content_hash, fetched_at, changed_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET
+              content_hash = excluded.content_hash,
+              fetched_at = excluded.fetched_at,
+              changed_at = excluded.changed_at
+            """, (url, digest, now, now))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return changed
+
+    def movies(self):
+        return pd.read_sql_query("SELECT * FROM movies ORDER BY rank", self.connection)
+
+    def history(self, title=None):
+        if title is None:
+            return pd.read_sql_query(
+                "SELECT * FROM movie_history ORDER BY title_id, valid_to", self.connection)
+        return pd.read_sql_query(
+            "SELECT * FROM movie_history WHERE title = ? ORDER BY title_id, valid_to",
+            self.connection, params=(title,))
+
+
+# Fetch the pages and store them. Returns the number of unchanged pages and
+# of inserted or updated movies.
+def scrape(urls, store, crawler=None):
+    crawler = crawler or Crawler()
+    pages = crawler.crawl(urls)
+    unchanged = 0
+    changed_movies = 0
+    for page_url, body in pages.items():
+        changed = store.store_page(page_url, body)
+        if changed is None:
+            unchanged += 1
+        else:
+            changed_movies += changed
+    return {'pages': len(pages), 'unchanged_pages': unchanged,
+            'changed_movies': changed_movies, 'failed_pages': len(crawler.errors)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', default='imdb.sqlite')
+    parser.add_argument('--pages', type=int, default=3)
+    parser.add_argument('--fixtures', action='store_true',
+                        help='scrape the local stand-in instead of IMDb')
+    args = parser.parse_args()
+
+    store = ScrapeStore(args.database)
+    if args.fixtures:
+        # A fixed port, so the page urls are the same on every run
+        with FixtureServer(port=8765) as server:
+            print(scrape(page_urls(server.url + search_path, args.pages), store))
+    else:
+        print(scrape(page_urls(url, args.pages), store))
+    store.close()
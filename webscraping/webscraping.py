@@ -40,9 +40,10 @@ def parse_movie(node):
     return {"rank": rank, "title": title, "runtime": runtime, 
             "rating": rating, "number_of_votes": number_of_votes, "metascore": metascore}
 
-movies = pd.DataFrame()
-for x in results:
-    movies = movies.append(parse_movie(x), ignore_index = True)
+# Build the DataFrame once from all rows: appending row by row copies the
+# whole frame every time (and DataFrame.append no longer exists in pandas 2)
+# For many pages see movie_parser.py (lxml, compiled selectors, process pool)
+movies = pd.DataFrame([parse_movie(x) for x in results])
 
 movies["number_of_votes"] = movies["number_of_votes"].str.replace(',', '').astype(float)
 movies["rank"] = movies["rank"].str.replace('.', '').astype(int)